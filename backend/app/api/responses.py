@@ -0,0 +1,10 @@
+from typing import Any
+from fastapi.responses import JSONResponse
+from app.core.fastjson import dumps
+
+
+class FastJSONResponse(JSONResponse):
+    """Default API response class: JSONResponse encoded with app.core.fastjson."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
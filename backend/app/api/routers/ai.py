@@ -1,12 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from app.api.deps import get_current_user
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.deps import get_current_user, get_db
 from app.core.config import get_settings
-import os, asyncio, logging
+from app.db.models import Project
+from app.services.ai_client import get_ai_client
+from app.services.ai_context import (
+    build_context,
+    extract_imports,
+    imports_index,
+    related_paths,
+)
+from app.services.files import file_versions, read_files
+import os, asyncio, logging, posixpath
 from typing import List
 
 settings = get_settings()
 router = APIRouter(prefix="/ai", tags=["ai"])
+# Related files read per request; the prompt budget rarely fits more
+MAX_RELATED_FILES = 16
 
 
 class SuggestRequest(BaseModel):
@@ -14,7 +26,7 @@ class SuggestRequest(BaseModel):
     content: str
     cursor_line: int
     cursor_col: int
-    project_id: int | None = None
+    project_id: str | None = None
     prefix: str | None = None  # optional already extracted prefix
     suffix: str | None = None  # optional suffix
     max_tokens: int = 120
@@ -44,25 +56,57 @@ def _fallback_suggestion(req: SuggestRequest) -> str:
     return f"{pad}# suggestion\n{pad}pass\n"
 
 
-async def _openai_suggest(req: SuggestRequest) -> str | None:
+def _api_key() -> str | None:
     # Prefer settings (env validated) over raw os.getenv for safety/centralization
-    api_key = settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        logging.getLogger("ai").debug("Skipping OpenAI: no API key")
-        return None
-    try:
-        from openai import AsyncOpenAI
+    return settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
+
+
+async def _related_files(
+    db: AsyncSession, project_id: str, path: str, content: str
+) -> dict[str, str]:
+    """Contents of the files related to `path`, read by path. Only files of
+    the same kind whose version changed since the last request are read to
+    refresh their imports."""
+    versions = await file_versions(db, project_id)
+    ext = posixpath.splitext(path)[1]
+    same_ext = {p: v for p, v in versions.items() if posixpath.splitext(p)[1] == ext}
+    stale = imports_index.stale(project_id, same_ext)
+    known = imports_index.update(
+        project_id, versions, await read_files(db, project_id, stale)
+    )
+    project_imports = {p: known.get(p, []) for p in versions}
+    project_imports[path] = extract_imports(path, content)
+    related = related_paths(path, project_imports[path], project_imports)
+    return await read_files(db, project_id, related[:MAX_RELATED_FILES])
+
+
+async def _build_snippet(req: SuggestRequest, db: AsyncSession, user) -> str:
+    files = None
+    if req.project_id:
+        proj = await db.get(Project, req.project_id)
+        if proj and proj.owner_id == user.id:
+            files = await _related_files(db, req.project_id, req.path, req.content)
+    return build_context(
+        req.path,
+        req.content,
+        req.cursor_line,
+        req.cursor_col,
+        files=files,
+        budget=settings.AI_CONTEXT_TOKENS,
+        prefix=req.prefix,
+        suffix=req.suffix,
+    )
+
 
-        client = AsyncOpenAI(api_key=api_key)
-        # Build prompt with small window around cursor
-        lines = req.content.splitlines()
-        before = lines[max(0, req.cursor_line - 11) : req.cursor_line]
-        after = lines[req.cursor_line : req.cursor_line + 10]
+async def _openai_suggest(
+    req: SuggestRequest, snippet: str, api_key: str
+) -> str | None:
+    try:
+        client = get_ai_client(api_key)
         prompt = (
             "You are an AI code completion engine. Return only the code that should follow the current cursor.\n"
             "Do NOT repeat existing code. Avoid explanations. Provide up to a few logical lines.\n"
         )
-        snippet = "\n".join(before) + "\n<cursor>\n" + "\n".join(after)
         model = settings.AI_MODEL or os.getenv("AI_MODEL", "gpt-4o-mini")
         logging.getLogger("ai").debug(
             "Calling OpenAI completion model=%s path=%s line=%d col=%d",
@@ -94,9 +138,18 @@ async def _openai_suggest(req: SuggestRequest) -> str | None:
 
 
 @router.post("/suggest", response_model=SuggestResponse)
-async def suggest(req: SuggestRequest, user=Depends(get_current_user)):
-    # Attempt LLM, fallback to heuristic
-    llm = await _openai_suggest(req)
+async def suggest(
+    req: SuggestRequest,
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    # Attempt LLM, fallback to heuristic; no project reads without a key
+    api_key = _api_key()
+    llm = None
+    if api_key:
+        llm = await _openai_suggest(req, await _build_snippet(req, db, user), api_key)
+    else:
+        logging.getLogger("ai").debug("Skipping OpenAI: no API key")
     if not llm:
         llm = _fallback_suggestion(req)
         model = "fallback"
@@ -112,13 +165,20 @@ async def suggest(req: SuggestRequest, user=Depends(get_current_user)):
 
 
 from fastapi.responses import StreamingResponse
-import json
+from app.core.fastjson import dumps_str
 
 
 @router.post("/suggest/stream")
-async def suggest_stream(req: SuggestRequest, user=Depends(get_current_user)):
+async def suggest_stream(
+    req: SuggestRequest,
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    api_key = _api_key()
+    # Built up front: the db session is released before the stream body runs
+    snippet = await _build_snippet(req, db, user) if api_key else None
+
     async def event_gen():
-        api_key = settings.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
         used_model = (
             (settings.AI_MODEL or os.getenv("AI_MODEL", "gpt-4o-mini"))
             if api_key
@@ -127,13 +187,7 @@ async def suggest_stream(req: SuggestRequest, user=Depends(get_current_user)):
         # Try streaming from OpenAI
         if api_key:
             try:
-                from openai import AsyncOpenAI
-
-                client = AsyncOpenAI(api_key=api_key)
-                lines = req.content.splitlines()
-                before = lines[max(0, req.cursor_line - 21) : req.cursor_line]
-                after = lines[req.cursor_line : req.cursor_line + 10]
-                snippet = "\n".join(before) + "\n<cursor>\n" + "\n".join(after)
+                client = get_ai_client(api_key)
                 prompt = (
                     "You are an AI code completion engine. Stream ONLY code that should follow the cursor. "
                     "Avoid repeating existing code. Provide logical continuation, can span multiple lines."
@@ -151,14 +205,14 @@ async def suggest_stream(req: SuggestRequest, user=Depends(get_current_user)):
                 async for part in stream:
                     delta = getattr(part.choices[0].delta, "content", None)
                     if delta:
-                        yield f"data: {json.dumps({'delta': delta})}\n\n"
-                yield f"data: {json.dumps({'done': True, 'model': used_model})}\n\n"
+                        yield f"data: {dumps_str({'delta': delta})}\n\n"
+                yield f"data: {dumps_str({'done': True, 'model': used_model})}\n\n"
                 return
             except Exception:
                 pass
         # Fallback single chunk
         comp = _fallback_suggestion(req)
-        yield f"data: {json.dumps({'delta': comp})}\n\n"
-        yield f"data: {json.dumps({'done': True, 'model': 'fallback'})}\n\n"
+        yield f"data: {dumps_str({'delta': comp})}\n\n"
+        yield f"data: {dumps_str({'done': True, 'model': 'fallback'})}\n\n"
 
     return StreamingResponse(event_gen(), media_type="text/event-stream")
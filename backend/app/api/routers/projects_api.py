@@ -1,10 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64, re, tempfile
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import undefer_group
 from app.api.deps import get_current_user, get_db
-from app.db.models import Project, File
-from app.schemas.project import ProjectCreate, ProjectOut, FileIn, FileOut
+from app.db.models import Project, File, Run
+from app.schemas.project import (
+    ProjectCreate,
+    ProjectOut,
+    FileIn,
+    FileOut,
+    ImportReport,
+    SearchPage,
+)
+from app.schemas.run import RunOut, RunPage
+from app.core.config import get_settings
+from app.queues.redis import get_redis
+from app.services import memo
+from app.services.archive import (
+    FORMATS,
+    ArchiveError,
+    ArchiveTooLarge,
+    export_project,
+    import_archive,
+)
+from app.services.search import SearchError, search_files
 
+settings = get_settings()
 router = APIRouter(prefix="/projects", tags=["projects"])
 
 
@@ -101,3 +125,130 @@ async def delete_file(
     await db.delete(f)
     await db.commit()
     return {"deleted": True}
+
+
+@router.delete("/{pid}/run-cache")
+async def clear_run_cache(
+    pid: str, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)
+):
+    """Forget memoized results of the project's deterministic runs."""
+    proj = await db.get(Project, pid)
+    if not proj or proj.owner_id != user.id:
+        raise HTTPException(404, "project not found")
+    async with get_redis() as r:
+        await memo.invalidate(r, pid)
+    return {"invalidated": True}
+
+
+@router.get("/{pid}/export")
+async def export_files(
+    pid: str,
+    format: str = Query("tar.gz", pattern=r"^(tar\.gz|zip)$"),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    proj = await db.get(Project, pid)
+    if not proj or proj.owner_id != user.id:
+        raise HTTPException(404, "project not found")
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", proj.name).strip("_") or "project"
+    return StreamingResponse(
+        export_project(pid, format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
+
+
+@router.post("/{pid}/import", response_model=ImportReport)
+async def import_files(
+    pid: str,
+    request: Request,
+    strip: int = Query(0, ge=0, le=16),
+    replace: bool = False,
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """Body: a zip or tar(.gz/.bz2/.xz) archive. `strip` drops leading path
+    components (1 for GitHub-style archives); `replace` deletes the
+    project's files that aren't in the archive."""
+    proj = await db.get(Project, pid)
+    if not proj or proj.owner_id != user.id:
+        raise HTTPException(404, "project not found")
+    # zip needs random access, so the body goes to a (disk-backed) spool
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.IMPORT_MAX_BYTES:
+                raise HTTPException(413, "archive too large")
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            report = await import_archive(db, pid, spool, strip, replace)
+        except ArchiveTooLarge as e:
+            raise HTTPException(413, str(e))
+        except ArchiveError as e:
+            raise HTTPException(400, str(e))
+    return ImportReport(**report)
+
+
+@router.get("/{pid}/search", response_model=SearchPage)
+async def search(
+    pid: str,
+    q: str = Query(..., min_length=1, max_length=500),
+    regex: bool = False,
+    case: bool = False,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    proj = await db.get(Project, pid)
+    if not proj or proj.owner_id != user.id:
+        raise HTTPException(404, "project not found")
+    try:
+        items, next_cursor = await search_files(
+            db, pid, q, regex=regex, case=case, limit=limit, cursor=cursor
+        )
+    except SearchError as e:
+        raise HTTPException(400, str(e))
+    return SearchPage(items=items, next_cursor=next_cursor)
+
+
+def _encode_cursor(run: Run) -> str:
+    raw = f"{run.created_at.isoformat()}|{run.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        ts, rid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(ts), rid
+    except Exception:
+        raise HTTPException(400, "invalid cursor")
+
+
+@router.get("/{pid}/runs", response_model=RunPage)
+async def list_runs(
+    pid: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = None,
+    include_output: bool = False,
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    proj = await db.get(Project, pid)
+    if not proj or proj.owner_id != user.id:
+        raise HTTPException(404, "project not found")
+    # Newest first, keyset on (created_at, id) served by ix_runs_project_created_id
+    stmt = select(Run).where(Run.project_id == pid)
+    if cursor:
+        stmt = stmt.where(tuple_(Run.created_at, Run.id) < _decode_cursor(cursor))
+    stmt = stmt.order_by(Run.created_at.desc(), Run.id.desc()).limit(limit + 1)
+    if include_output:
+        stmt = stmt.options(undefer_group("output"))
+    runs = (await db.execute(stmt)).scalars().all()
+    page = runs[:limit]
+    return RunPage(
+        items=[RunOut.model_validate(r.__dict__) for r in page],
+        next_cursor=_encode_cursor(page[-1]) if len(runs) > limit else None,
+    )
@@ -1,37 +1,104 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import undefer_group
 from app.api.deps import get_current_user, get_db
-from app.db.models import Project, Run
+from app.db.models import Project, Run, utcnow
 from app.db.enums import RunStatus
-from app.schemas.run import RunCreate, RunOut
+from app.core.config import get_settings
+from app.core.tracing import Timeline
+from app.queues.redis import get_redis
+from app.schemas.run import RunCreate, RunOut, RunOutputPage
 from app.services.files import list_project_files
-from app.services.run import enqueue_run
+from app.services.output import read_output_page
+from app.services import memo
+from app.services.run import enqueue_run, publish_event
 
+settings = get_settings()
 router = APIRouter(prefix="/runs", tags=["runs"])
 
 
+async def _get_owned_run(
+    db: AsyncSession, run_id: str, user, with_output: bool = False
+) -> Run:
+    stmt = (
+        select(Run)
+        .join(Project, Project.id == Run.project_id)
+        .where(Run.id == run_id, Project.owner_id == user.id)
+    )
+    if with_output:
+        stmt = stmt.options(undefer_group("output"))
+    res = await db.execute(stmt)
+    run = res.scalar_one_or_none()
+    if not run:
+        raise HTTPException(404, "run not found")
+    return run
+
+
+async def _finish_cached(db: AsyncSession, run: Run, cached: dict, tl: Timeline):
+    """Store `run` as already finished with a memoized result and publish
+    the final event a worker would have sent; nothing is queued."""
+    for field in memo.FIELDS:
+        setattr(run, field, cached[field])
+    run.finished_at = utcnow()
+    run.timeline = tl.to_dict()
+    db.add(run)
+    await db.commit()
+    final = {k: cached[k] for k in ("status", "stdout", "stderr", "wall_ms")}
+    async with get_redis() as r:
+        await publish_event(
+            r, run.id, {"type": "update", **final, "truncated": False, "cached": True}
+        )
+    return {"run_id": run.id, "cached": True}
+
+
 @router.post("/start", response_model=dict)
 async def start_run(
     pid: str,
     payload: RunCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user=Depends(get_current_user),
 ):
+    # Join the caller's trace if it sent a W3C traceparent header
+    tl = Timeline.from_traceparent(request.headers.get("traceparent"))
     proj = await db.get(Project, pid)
     if not proj or proj.owner_id != user.id:
         raise HTTPException(404, "project not found")
+    with tl.span("api.load_files"):
+        files = await list_project_files(db, pid)
+    memo_key = cached = None
+    # session runs depend on kernel state, so they are never memoized
+    if payload.deterministic and not payload.session:
+        with tl.span("api.memo_lookup"):
+            async with get_redis() as r:
+                key = await memo.memo_key(
+                    r, pid, payload.language, payload.entrypoint, files
+                )
+                cached = await memo.lookup(r, key) if key else None
+        memo_key = None if cached else key
     run = Run(
         project_id=pid,
         language=payload.language,
         entrypoint=payload.entrypoint,
         status=RunStatus.queued.value,
     )
-    db.add(run)
-    await db.commit()
-    await db.refresh(run)
-    files = await list_project_files(db, pid)
-    await enqueue_run(db, run, files)
+    if cached:
+        return await _finish_cached(db, run, cached, tl)
+    with tl.span("api.create_run"):
+        db.add(run)
+        await db.commit()
+        await db.refresh(run)
+    await enqueue_run(
+        db,
+        run,
+        files,
+        tl,
+        session=payload.session,
+        reset_session=payload.reset_session,
+        memo_key=memo_key,
+    )
     return {"run_id": run.id}
 
 
@@ -39,7 +106,21 @@ async def start_run(
 async def get_run(
     run_id: str, db: AsyncSession = Depends(get_db), user=Depends(get_current_user)
 ):
-    run = await db.get(Run, run_id)
-    if not run:
-        raise HTTPException(404, "run not found")
+    run = await _get_owned_run(db, run_id, user, with_output=True)
     return RunOut.model_validate(run.__dict__)
+
+
+@router.get("/{run_id}/output", response_model=RunOutputPage)
+async def get_run_output(
+    run_id: str,
+    stream: str = Query("stdout", pattern="^(stdout|stderr)$"),
+    offset: int = Query(0, ge=0),
+    # a page must fit the widest UTF-8 character, or it could never end on one
+    limit: int = Query(64 * 1024, ge=4),
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    run = await _get_owned_run(db, run_id, user, with_output=True)
+    limit = min(limit, settings.RUN_OUTPUT_PAGE_MAX_BYTES)
+    page = await asyncio.to_thread(read_output_page, run, stream, offset, limit)
+    return RunOutputPage(**page)
@@ -1,25 +1,43 @@
 from fastapi import APIRouter, WebSocket
 from app.core.config import get_settings
-from app.queues.redis import get_redis
+from app.core.fastjson import loads
+from app.core.metrics import WS_OPEN
+from app.db.enums import RunStatus
+from app.queues.redis import get_redis, LAST_EVENT_PREFIX
 
 router = APIRouter()
 settings = get_settings()
+TERMINAL = {RunStatus.succeeded.value, RunStatus.failed.value, RunStatus.killed.value}
 
 
 @router.websocket("/runs/{run_id}/stream")
 async def ws_stream(ws: WebSocket, run_id: str):
     await ws.accept()
     channel = settings.EVENT_CHANNEL_PREFIX + run_id
-    async with get_redis() as r:
-        pubsub = r.pubsub()
-        await pubsub.subscribe(channel)
-        try:
-            # Immediately tell the client we're connected
-            await ws.send_json({"t": "state", "status": "subscribed"})
-            async for msg in pubsub.listen():
-                if msg["type"] != "message":
-                    continue
-                await ws.send_bytes(msg["data"])  # already JSON bytes from runner
-        finally:
-            await pubsub.unsubscribe(channel)
-            await ws.close()
+    WS_OPEN.inc()
+    try:
+        async with get_redis() as r:
+            pubsub = r.pubsub()
+            await pubsub.subscribe(channel)
+            try:
+                # Immediately tell the client we're connected
+                await ws.send_json({"t": "state", "status": "subscribed"})
+                # Catch up on whatever was published before we subscribed
+                last = await r.get(LAST_EVENT_PREFIX + run_id)
+                if last:
+                    await ws.send_bytes(last)
+                    if loads(last).get("status") in TERMINAL:
+                        return
+                async for msg in pubsub.listen():
+                    if msg["type"] != "message":
+                        continue
+                    await ws.send_bytes(msg["data"])  # already JSON bytes from runner
+                    # nothing follows a terminal event; don't hold the socket
+                    if loads(msg["data"]).get("status") in TERMINAL:
+                        return
+            finally:
+                await pubsub.unsubscribe(channel)
+                await pubsub.aclose()  # return its connection to the shared pool
+                await ws.close()
+    finally:
+        WS_OPEN.dec()
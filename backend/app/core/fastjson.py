@@ -0,0 +1,37 @@
+"""JSON codec for the hot paths: API responses, queue payloads, run events,
+runner IPC and log lines.
+
+Uses orjson when it is installed and falls back to the stdlib otherwise;
+both produce compact UTF-8 bytes, so callers don't care which one ran.
+"""
+
+import json
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+if orjson:
+    _OPTS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any, default: Callable | None = None) -> bytes:
+        return orjson.dumps(obj, default=default, option=_OPTS)
+
+    loads = orjson.loads
+
+else:
+
+    def dumps(obj: Any, default: Callable | None = None) -> bytes:
+        return json.dumps(
+            obj, default=default, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+    loads = json.loads
+
+
+def dumps_str(obj: Any, default: Callable | None = None) -> str:
+    return dumps(obj, default).decode()
@@ -1,4 +1,5 @@
-import logging, json, sys
+import logging, sys
+from app.core.fastjson import dumps_str
 
 
 class JsonFormatter(logging.Formatter):
@@ -11,7 +12,7 @@ class JsonFormatter(logging.Formatter):
         }
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(payload)
+        return dumps_str(payload)
 
 
 def setup_logging():
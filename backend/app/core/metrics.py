@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# API
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the last body chunk is sent",
+    ["router", "method", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+WS_OPEN = Gauge("websocket_connections_open", "Open run event WebSockets")
+DB_POOL = Gauge("db_pool_connections", "SQLAlchemy pool connections", ["state"])
+REDIS_POOL = Gauge("redis_pool_connections", "Redis connection pool", ["state"])
+# lookups (hit/miss) in the API; stored/too_large/evicted in the worker
+RUN_MEMO = Counter("run_memo_total", "Deterministic run result cache", ["result"])
+
+# Worker
+RUN_STREAM_LENGTH = Gauge("run_stream_length", "Entries in the run job streams")
+RUN_STREAM_PENDING = Gauge(
+    "run_stream_pending", "Delivered but unacknowledged run jobs in the groups"
+)
+RUNS_IN_FLIGHT = Gauge("runs_in_flight", "Run jobs currently being processed")
+RUNS_TOTAL = Counter("runs_total", "Run jobs processed", ["status"])
+RUN_SHARDS_OWNED = Gauge("run_shards_owned", "Run stream shards this worker reads")
+RUN_JOBS_TAKEN = Counter(
+    "run_jobs_taken_total", "Run jobs read from shards not owned", ["how"]
+)
+RUN_SESSIONS = Gauge("run_sessions_open", "Warm kernel sessions on this worker")
+RUN_SESSION_EVICTIONS = Counter(
+    "run_session_evictions_total", "Closed kernel sessions", ["reason"]
+)
+RUN_WORKSPACES = Counter(
+    "run_workspace_checkouts_total", "JavaScript workspace checkouts", ["result"]
+)
+RUN_WORKSPACE_WRITES = Counter(
+    "run_workspace_files_written_total", "Files written into JavaScript workspaces"
+)
+RUN_PHASE = Histogram(
+    "run_phase_duration_seconds",
+    "Time spent per run pipeline phase",
+    ["phase"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+@contextmanager
+def timed(phase: str, timeline=None):
+    """Observe `phase` in RUN_PHASE and, if given, record it on a run's
+    trace timeline as well."""
+    t0 = time.perf_counter()
+    start_ms = time.time() * 1000
+    try:
+        yield
+    finally:
+        RUN_PHASE.labels(phase).observe(time.perf_counter() - t0)
+        if timeline is not None:
+            timeline.add(phase, start_ms, time.time() * 1000)
+
+
+def _router_label(scope) -> str:
+    route = scope.get("route")
+    endpoint = getattr(route, "endpoint", None)
+    if endpoint is None:
+        return "unmatched"
+    # app.api.routers.<module> -> <module>; anything else (health, metrics) -> app
+    module = endpoint.__module__
+    if module.startswith("app.api.routers."):
+        return module.rsplit(".", 1)[-1]
+    return "app"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to completion."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_LATENCY.labels(
+                _router_label(scope), scope["method"], str(status)
+            ).observe(time.perf_counter() - t0)
+
+
+def collect_db_pool(engine):
+    pool = engine.pool
+    for state, fn in (
+        ("size", "size"),
+        ("checked_out", "checkedout"),
+        ("checked_in", "checkedin"),
+        ("overflow", "overflow"),
+    ):
+        if hasattr(pool, fn):  # NullPool/StaticPool expose none of these
+            DB_POOL.labels(state).set(getattr(pool, fn)())
+
+
+def collect_redis_pool(client):
+    pool = client.connection_pool
+    # redis-py exposes no accessors for these; other pools may lack them
+    for state, attr in (
+        ("in_use", "_in_use_connections"),
+        ("available", "_available_connections"),
+    ):
+        conns = getattr(pool, attr, None)
+        if conns is not None:
+            REDIS_POOL.labels(state).set(len(conns))
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,144 @@
+import asyncio, logging, os, re, time
+from contextlib import contextmanager
+from app.core.config import get_settings
+
+settings = get_settings()
+log = logging.getLogger("tracing")
+
+# W3C trace context: 00-<32 hex trace id>-<16 hex parent span id>-<flags>
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+def _hex_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def now_ms() -> float:
+    return time.time() * 1000
+
+
+class Timeline:
+    """Timestamped spans of one run, from the API request to the runner.
+
+    Spans are `[name, start_ms, dur_ms]` with `start_ms` relative to the
+    timeline start, which keeps the stored JSON small. A timeline travels
+    with the job payload (`to_dict` / `from_dict`) so every stage appends
+    to the same trace.
+    """
+
+    def __init__(
+        self,
+        trace_id: str | None = None,
+        parent_id: str | None = None,
+        start_ms: float | None = None,
+        spans: list | None = None,
+    ):
+        self.trace_id = trace_id or _hex_id(16)
+        self.parent_id = parent_id
+        self.start_ms = now_ms() if start_ms is None else start_ms
+        self.spans = spans or []
+
+    @classmethod
+    def from_traceparent(cls, header: str | None) -> "Timeline":
+        m = _TRACEPARENT.match((header or "").strip().lower())
+        if m and m[1] != "0" * 32:
+            return cls(trace_id=m[1], parent_id=m[2])
+        return cls()
+
+    @classmethod
+    def from_dict(cls, d: dict | None) -> "Timeline":
+        if not d:
+            return cls()
+        return cls(
+            d.get("trace_id"),
+            d.get("parent_id"),
+            d.get("start_ms"),
+            [list(s) for s in d.get("spans", [])],
+        )
+
+    def to_dict(self) -> dict:
+        d = {
+            "trace_id": self.trace_id,
+            "start_ms": round(self.start_ms, 3),
+            "spans": list(self.spans),
+        }
+        if self.parent_id:
+            d["parent_id"] = self.parent_id
+        return d
+
+    def add(self, name: str, start_ms: float, end_ms: float):
+        self.spans.append(
+            [name, round(start_ms - self.start_ms, 3), round(end_ms - start_ms, 3)]
+        )
+
+    @contextmanager
+    def span(self, name: str):
+        t0 = now_ms()
+        try:
+            yield
+        finally:
+            self.add(name, t0, now_ms())
+
+
+def otlp_payload(tl: Timeline, service: str, attrs: dict | None = None) -> dict:
+    """OTLP/HTTP JSON body: one root `run` span with a child per stage."""
+    root_id = _hex_id(8)
+    base = int(tl.start_ms * 1e6)
+    end = max([s[1] + s[2] for s in tl.spans] or [0])
+
+    def span(name, span_id, parent, start, dur, attributes=()):
+        s = {
+            "traceId": tl.trace_id,
+            "spanId": span_id,
+            "name": name,
+            "kind": 1,  # INTERNAL
+            "startTimeUnixNano": str(base + int(start * 1e6)),
+            "endTimeUnixNano": str(base + int((start + dur) * 1e6)),
+            "attributes": list(attributes),
+        }
+        if parent:
+            s["parentSpanId"] = parent
+        return s
+
+    root_attrs = [
+        {"key": k, "value": {"stringValue": str(v)}} for k, v in (attrs or {}).items()
+    ]
+    spans = [span("run", root_id, tl.parent_id, 0, end, root_attrs)]
+    spans += [span(n, _hex_id(8), root_id, start, dur) for n, start, dur in tl.spans]
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": "code_sandbox"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+_exports: set[asyncio.Task] = set()
+
+
+def export_timeline(tl: Timeline, attrs: dict | None = None):
+    """Best-effort, fire-and-forget export to OTLP_ENDPOINT (if configured)."""
+    if not settings.OTLP_ENDPOINT:
+        return
+    body = otlp_payload(tl, settings.OTLP_SERVICE_NAME, attrs)
+    task = asyncio.create_task(_post(body))
+    _exports.add(task)
+    task.add_done_callback(_exports.discard)
+
+
+async def _post(body: dict):
+    import httpx
+
+    url = settings.OTLP_ENDPOINT.rstrip("/") + "/v1/traces"
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            resp = await client.post(url, json=body)
+            resp.raise_for_status()
+    except Exception as e:
+        log.debug("OTLP export to %s failed: %r", url, e)
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column, relationship
-from sqlalchemy import Text, String, ForeignKey, TIMESTAMP, func, Boolean
+from sqlalchemy import JSON, Text, String, ForeignKey, TIMESTAMP, func, Boolean, Index
+from datetime import datetime, timezone
 from uuid import uuid4
 from app.db.enums import RunStatus
 
@@ -10,6 +11,10 @@ def gen_id():
     return str(uuid4())
 
 
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
 class User(Base):
     __tablename__ = "users"
     id: Mapped[str] = mapped_column(String, primary_key=True, default=gen_id)
@@ -57,17 +62,32 @@ class File(Base):
     created_at: Mapped[str] = mapped_column(
         TIMESTAMP(timezone=True), server_default=func.now()
     )
+    # Part of the file version AI context caches are keyed by
     updated_at: Mapped[str] = mapped_column(
-        TIMESTAMP(timezone=True), server_default=func.now()
+        TIMESTAMP(timezone=True),
+        default=utcnow,
+        onupdate=utcnow,
+        server_default=func.now(),
     )
     project: Mapped[Project] = relationship(back_populates="files")
 
+    __table_args__ = (
+        # Code search: trigram index serving LIKE/ILIKE over contents
+        Index(
+            "ix_files_content_trgm",
+            "content",
+            postgresql_using="gin",
+            postgresql_ops={"content": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
 
 class Run(Base):
     __tablename__ = "runs"
     id: Mapped[str] = mapped_column(String, primary_key=True, default=gen_id)
+    # indexed as the leading column of ix_runs_project_created_id
     project_id: Mapped[str] = mapped_column(
-        ForeignKey("projects.id", ondelete="CASCADE"), index=True
+        ForeignKey("projects.id", ondelete="CASCADE")
     )
     status: Mapped[RunStatus] = mapped_column(String, default=RunStatus.queued.value)
     language: Mapped[str] = mapped_column(String)
@@ -75,10 +95,40 @@ class Run(Base):
     cpu_ms: Mapped[int | None] = mapped_column(default=None)
     memory_mb: Mapped[int | None] = mapped_column(default=None)
     wall_ms: Mapped[int | None] = mapped_column(default=None)
-    stdout: Mapped[str | None] = mapped_column(Text, default=None)
-    stderr: Mapped[str | None] = mapped_column(Text, default=None)
+    # Large; only loaded on request via undefer_group("output")
+    stdout: Mapped[str | None] = mapped_column(
+        Text, default=None, deferred=True, deferred_group="output"
+    )
+    stderr: Mapped[str | None] = mapped_column(
+        Text, default=None, deferred=True, deferred_group="output"
+    )
+    # Full size of each stream; stdout/stderr hold head+tail when truncated
+    stdout_bytes: Mapped[int | None] = mapped_column(default=None)
+    stderr_bytes: Mapped[int | None] = mapped_column(default=None)
+    output_truncated: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default="false"
+    )
+    # Blob key prefix of the compressed full output, if spilled or archived
+    output_key: Mapped[str | None] = mapped_column(String, default=None)
+    # stdout/stderr moved to the blob store by the archiver
+    output_archived: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default="false"
+    )
+    # Trace timeline: {"trace_id", "start_ms", "spans": [[name, start, dur]]}
+    timeline: Mapped[dict | None] = mapped_column(JSON, default=None)
+    # Partition key (Postgres partitions runs by month), hence part of the PK.
+    # Set client-side so the target partition is known before the INSERT.
     created_at: Mapped[str] = mapped_column(
-        TIMESTAMP(timezone=True), server_default=func.now()
+        TIMESTAMP(timezone=True),
+        primary_key=True,
+        default=utcnow,
+        server_default=func.now(),
     )
     finished_at: Mapped[str | None] = mapped_column(TIMESTAMP(timezone=True))
     project: Mapped[Project] = relationship(back_populates="runs")
+
+    __table_args__ = (
+        # Run history keyset pagination: (created_at, id) within a project
+        Index("ix_runs_project_created_id", "project_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
@@ -0,0 +1,109 @@
+import logging, re
+from datetime import datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+log = logging.getLogger("db.partitions")
+
+# Monthly range partitions of `runs`, named runs_pYYYYMM. There is no
+# default partition: any row in one would block creating (and concurrently
+# detaching) monthly partitions, so partitions are created months ahead.
+_NAME = re.compile(r"^runs_p(\d{4})(\d{2})$")
+
+
+def month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(dt: datetime, n: int) -> datetime:
+    m = dt.month - 1 + n
+    return datetime(dt.year + m // 12, m % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(start: datetime) -> str:
+    return f"runs_p{start.year:04d}{start.month:02d}"
+
+
+async def runs_is_partitioned(conn: AsyncConnection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    res = await conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table pt"
+            " JOIN pg_class c ON c.oid = pt.partrelid"
+            " WHERE c.relname = 'runs' AND c.relnamespace = 'public'::regnamespace"
+        )
+    )
+    return res.first() is not None
+
+
+def _month(name: str) -> datetime | None:
+    m = _NAME.match(name)
+    return datetime(int(m[1]), int(m[2]), 1, tzinfo=timezone.utc) if m else None
+
+
+async def list_run_partitions(conn: AsyncConnection) -> list[tuple[str, datetime]]:
+    """(name, month start) of every monthly partition, oldest first."""
+    res = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i"
+            " JOIN pg_class c ON c.oid = i.inhrelid"
+            " JOIN pg_class p ON p.oid = i.inhparent"
+            " WHERE p.relname = 'runs'"
+        )
+    )
+    parts = [(name, _month(name)) for (name,) in res if _month(name)]
+    return sorted(parts, key=lambda p: p[1])
+
+
+async def _create_partition(conn: AsyncConnection, start: datetime):
+    end = add_months(start, 1)
+    await conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF runs"
+            f" FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    )
+
+
+async def ensure_run_partitions(
+    conn: AsyncConnection, now: datetime, months_back: int, months_ahead: int
+) -> list[str]:
+    """Create any missing monthly partitions in [now - back, now + ahead]."""
+    if not await runs_is_partitioned(conn):
+        return []
+    existing = {name for name, _ in await list_run_partitions(conn)}
+    created = []
+    first = add_months(month_start(now), -months_back)
+    for i in range(months_back + months_ahead + 1):
+        start = add_months(first, i)
+        name = partition_name(start)
+        if name in existing:
+            continue
+        await _create_partition(conn, start)
+        created.append(name)
+    if created:
+        log.info("created run partitions: %s", ", ".join(created))
+    return created
+
+
+async def expired_run_partitions(
+    conn: AsyncConnection, cutoff: datetime
+) -> list[tuple[str, bool]]:
+    """(name, detach pending) of partitions whose whole month lies before
+    `cutoff`, plus monthly tables already detached from `runs` (a retention
+    pass that stopped before dropping them) as (name, None)."""
+    res = await conn.execute(
+        text(
+            "SELECT c.relname, i.inhdetachpending FROM pg_class c"
+            " LEFT JOIN pg_inherits i ON i.inhrelid = c.oid"
+            " WHERE c.relkind = 'r' AND c.relname LIKE 'runs\\_p%'"
+            " AND c.relnamespace = 'public'::regnamespace"
+        )
+    )
+    expired = []
+    for name, pending in res:
+        start = _month(name)
+        if start and add_months(start, 1) <= cutoff:
+            expired.append((start, name, pending))
+    return [(name, pending) for _, name, pending in sorted(expired)]
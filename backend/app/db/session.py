@@ -1,15 +1,28 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from functools import lru_cache
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import get_settings
 
-settings = get_settings()
-engine = create_async_engine(settings.DATABASE_URL, future=True, echo=False)
 
-AsyncSessionLocal = sessionmaker(
-    bind=engine, autoflush=False, expire_on_commit=False, class_=AsyncSession
-)
+# Built on first use rather than at import: importing the app (or a worker)
+# shouldn't load the DB driver or touch the pool until a query needs it.
+@lru_cache
+def get_engine() -> AsyncEngine:
+    return create_async_engine(get_settings().DATABASE_URL, future=True, echo=False)
+
+
+@lru_cache
+def get_sessionmaker() -> sessionmaker:
+    return sessionmaker(
+        bind=get_engine(), autoflush=False, expire_on_commit=False, class_=AsyncSession
+    )
+
+
+async def dispose_engine():
+    if get_engine.cache_info().currsize:
+        await get_engine().dispose()
 
 
 async def get_session():
-    async with AsyncSessionLocal() as session:
+    async with get_sessionmaker()() as session:
         yield session
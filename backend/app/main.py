@@ -1,25 +1,63 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import get_settings
 from app.core.logging import setup_logging
+from app.core import metrics
+from app.api.responses import FastJSONResponse
 from app.api.routers import auth as r_auth
 from app.api.routers import run as r_run
 from app.api.routers import ws as r_ws
 from app.api.routers import projects_api as r_projects
 from app.api.routers import ai as r_ai
+from contextlib import asynccontextmanager
 from sqlalchemy import select
-from app.db.session import get_session
+from app.db.session import dispose_engine, get_engine, get_session
 from app.db.models import User
 from app.core.security import hash_password
+from app.queues.redis import close_redis, current_client
+from app.services.ai_client import close_ai_clients
 import os, asyncio
 
 setup_logging()
 settings = get_settings()
 
-app = FastAPI(title=settings.APP_NAME)
+
+async def ensure_admin():
+    email = os.getenv("ADMIN_EMAIL")
+    password = os.getenv("ADMIN_PASSWORD")
+    if not email or not password:
+        return
+    # create admin user if not exists
+    async for session in get_session():
+        exists = await session.execute(select(User).where(User.email == email))
+        if exists.scalar_one_or_none():
+            return
+        u = User(email=email, password_hash=hash_password(password), is_admin=True)
+        session.add(u)
+        await session.commit()
+        return
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Engine, Redis and AI clients are created lazily on first use; the
+    # lifespan only bootstraps the admin and releases whatever got opened.
+    await ensure_admin()
+    yield
+    await close_ai_clients()
+    await close_redis()
+    await dispose_engine()
+
+
+app = FastAPI(
+    title=settings.APP_NAME,
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
+)
 app.add_middleware(
     CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(r_auth.router, prefix=settings.API_PREFIX)
 app.include_router(r_projects.router, prefix=settings.API_PREFIX)
@@ -33,18 +71,11 @@ async def health():
     return {"ok": True}
 
 
-@app.on_event("startup")
-async def ensure_admin():
-    email = os.getenv("ADMIN_EMAIL")
-    password = os.getenv("ADMIN_PASSWORD")
-    if not email or not password:
-        return
-    # create admin user if not exists
-    async for session in get_session():
-        exists = await session.execute(select(User).where(User.email == email))
-        if exists.scalar_one_or_none():
-            return
-        u = User(email=email, password_hash=hash_password(password), is_admin=True)
-        session.add(u)
-        await session.commit()
-        return
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    if get_engine.cache_info().currsize:  # don't build the engine for a scrape
+        metrics.collect_db_pool(get_engine())
+    if current_client() is not None:
+        metrics.collect_redis_pool(current_client())
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
@@ -1,20 +1,55 @@
-from redis import asyncio as aioredis
+import zlib
 from contextlib import asynccontextmanager
 from app.core.config import get_settings
 
 settings = get_settings()
+_client = None
+
+
+def _get_client():
+    # One pooled client per process, created on first use (not at import)
+    global _client
+    if _client is None:
+        from redis import asyncio as aioredis
+
+        _client = aioredis.from_url(settings.REDIS_URL, decode_responses=False)
+    return _client
+
+
+def current_client():
+    """The process's client if one was created yet (for metrics), else None."""
+    return _client
 
 
 @asynccontextmanager
 async def get_redis():
-    r = aioredis.from_url(settings.REDIS_URL, decode_responses=False)
-    try:
-        yield r
-    finally:
-        await r.aclose()
+    yield _get_client()
+
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
 
 
 RUN_STREAM = settings.RUN_STREAM
 RUN_GROUP = settings.RUN_GROUP
 EVENT_PREFIX = settings.EVENT_CHANNEL_PREFIX
+LAST_EVENT_PREFIX = settings.EVENT_LAST_PREFIX
 SNAP_PREFIX = settings.SNAPSHOT_PREFIX
+MEMO_PREFIX = settings.RUN_MEMO_PREFIX
+WORKERS_KEY = settings.RUN_WORKERS_KEY
+
+
+def shard_streams() -> list[str]:
+    if settings.RUN_SHARDS <= 0:
+        return [RUN_STREAM]
+    return [f"{RUN_STREAM}:{n}" for n in range(settings.RUN_SHARDS)]
+
+
+def shard_stream(project_id: str) -> str:
+    """The run stream for `project_id`; a project always maps to one shard."""
+    if settings.RUN_SHARDS <= 0:
+        return RUN_STREAM
+    return f"{RUN_STREAM}:{zlib.crc32(project_id.encode()) % settings.RUN_SHARDS}"
@@ -1,46 +1,274 @@
-import json, sys, time, traceback
+import contextlib, json, os, signal, sys, time, traceback
+from collections import deque
+
+# Mirrors app.core.fastjson; the runner is started as a standalone script.
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+    _loads = json.loads
+
+DEFAULT_HEAD_BYTES = 64 * 1024
+DEFAULT_TAIL_BYTES = 64 * 1024
+SPILL_CHUNK_BYTES = 256 * 1024
+
+
+class ChunkedGzipWriter:
+    """Gzip file written as independent members of `chunk` bytes each.
+
+    `<path>.idx` holds the chunk size followed by the compressed offset of
+    every member (8-byte big-endian each), so a reader can decompress from
+    any chunk instead of from the start. Still a valid multi-member gzip.
+    """
+
+    def __init__(self, path: str, chunk: int = SPILL_CHUNK_BYTES):
+        self.chunk = chunk
+        self.buf = bytearray()
+        self.f = open(path, "wb")
+        self.idx = open(path + ".idx", "wb")
+        self.idx.write(chunk.to_bytes(8, "big"))
+
+    def write(self, data: bytes):
+        self.buf += data
+        while len(self.buf) >= self.chunk:
+            self._member(self.buf[: self.chunk])
+            del self.buf[: self.chunk]
+
+    def _member(self, data):
+        import gzip
+
+        self.idx.write(self.f.tell().to_bytes(8, "big"))
+        self.f.write(gzip.compress(bytes(data), 6, mtime=0))
+
+    def close(self):
+        if self.buf:
+            self._member(self.buf)
+        self.f.close()
+        self.idx.close()
+
+
+class OutputBuffer:
+    """Bounded capture of one output stream.
+
+    Keeps the first `head` and the last `tail` bytes in memory; everything in
+    between is only counted. When `spill_path` is given and the stream
+    outgrows head + tail, the full stream (up to `spill_max` bytes) is also
+    written there as a `ChunkedGzipWriter`.
+    """
+
+    def __init__(
+        self,
+        head: int = DEFAULT_HEAD_BYTES,
+        tail: int = DEFAULT_TAIL_BYTES,
+        spill_path: str | None = None,
+        spill_max: int = 0,
+    ):
+        self.head_limit = head
+        self.tail_limit = tail
+        self.head = bytearray()
+        self.tail: deque[bytes] = deque()
+        self.tail_len = 0
+        self.total = 0
+        self.spill_max = spill_max
+        self.spilled = 0
+        self.spill_path = spill_path if spill_max > 0 else None
+        self._spill = None
+
+    def _spill_write(self, data: bytes):
+        part = data[: self.spill_max - self.spilled]
+        if part:
+            self._spill.write(part)
+            self.spilled += len(part)
+
+    def _open_spill(self):
+        # nothing was dropped yet: head + tail is the whole stream so far
+        self._spill = ChunkedGzipWriter(self.spill_path)
+        self._spill_write(bytes(self.head) + b"".join(self.tail))
+
+    def write(self, s) -> int:
+        data = s.encode("utf-8", "replace") if isinstance(s, str) else bytes(s)
+        if not data:
+            return 0
+        if (
+            self._spill is None
+            and self.spill_path
+            and self.total + len(data) > self.head_limit + self.tail_limit
+        ):
+            self._open_spill()
+        self.total += len(data)
+        if self._spill is not None:
+            self._spill_write(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data and self.tail_limit > 0:
+            self.tail.append(data)
+            self.tail_len += len(data)
+            while self.tail_len - len(self.tail[0]) >= self.tail_limit:
+                self.tail_len -= len(self.tail.popleft())
+        return len(s)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.head) + min(self.tail_len, self.tail_limit)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+            self.spill_path = None
+
+    def getvalue(self) -> str:
+        tail = b"".join(self.tail)
+        if not self.truncated:
+            return (bytes(self.head) + tail).decode("utf-8", "replace")
+        tail = tail[-self.tail_limit :] if self.tail_limit else b""
+        dropped = self.total - len(self.head) - len(tail)
+        # cuts may split a multi-byte character; drop the partial bytes
+        return (
+            bytes(self.head).decode("utf-8", "ignore")
+            + f"\n... [{dropped} bytes truncated] ...\n"
+            + tail.decode("utf-8", "ignore")
+        )
+
+
+class _Stream:
+    """Minimal text stream so print()/sys.stdout.write() land in a buffer."""
+
+    def __init__(self, buf: OutputBuffer):
+        self.buf = buf
+
+    def write(self, s):
+        return self.buf.write(s)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _pump(pipe, buf: OutputBuffer):
+    import codecs
+
+    dec = codecs.getincrementaldecoder("utf-8")("replace")
+    while True:
+        chunk = pipe.read1(65536)
+        if not chunk:
+            break
+        buf.write(dec.decode(chunk))
+    buf.write(dec.decode(b"", final=True))
+
+
+class _Spans(list):
+    """Runner stages as [name, epoch start ms, duration ms], reported back so
+    the worker can add them to the run's trace timeline."""
+
+    @contextlib.contextmanager
+    def span(self, name):
+        t0 = time.time() * 1000
+        try:
+            yield
+        finally:
+            self.append([name, round(t0, 3), round(time.time() * 1000 - t0, 3)])
+
+
+def _emit(result: dict):
+    try:
+        data = _dumps(result)
+    except TypeError:
+        # lone surrogates in program output: orjson refuses them, so replace
+        # them rather than emit JSON the worker couldn't decode either
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8", "replace")
+    # __stdout__: also from the SIGTERM handler, while print() is redirected
+    sys.__stdout__.buffer.write(data + b"\n")
+    sys.__stdout__.buffer.flush()
+
+
+def _result(status, stdout, stderr, wall_ms, spans=()):
+    return {
+        "status": status,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "stdout_bytes": stdout.total,
+        "stderr_bytes": stderr.total,
+        "truncated": stdout.truncated or stderr.truncated,
+        "wall_ms": wall_ms,
+        "spans": list(spans),
+    }
 
 
 def main():
-    raw = sys.stdin.read()
+    raw = sys.stdin.buffer.read()
     try:
-        payload = json.loads(raw)
+        payload = _loads(raw)
     except Exception:
-        print(
-            json.dumps(
-                {
-                    "status": "failed",
-                    "stdout": "",
-                    "stderr": "invalid json",
-                    "wall_ms": 0,
-                }
-            )
+        _emit(
+            {
+                "status": "failed",
+                "stdout": "",
+                "stderr": "invalid json",
+                "wall_ms": 0,
+            }
         )
         return
     files = payload.get("files", {})
     language = payload.get("language", "python")
     entry = payload.get("entrypoint", "main.py")
     start = time.time()
-    stdout = []
-    stderr = []
+    limits = payload.get("output", {})
+    spill_dir = limits.get("spill_dir")
+
+    def make_buffer(name):
+        return OutputBuffer(
+            head=limits.get("head_bytes", DEFAULT_HEAD_BYTES),
+            tail=limits.get("tail_bytes", DEFAULT_TAIL_BYTES),
+            spill_path=os.path.join(spill_dir, name + ".gz") if spill_dir else None,
+            spill_max=limits.get("spill_max_bytes", 0),
+        )
+
+    # javascript runs may come with the project already on disk
+    workdir = payload.get("workdir")
     code = files.get(entry)
+    if code is None and workdir and language == "javascript":
+        if os.path.isfile(os.path.join(workdir, entry)):
+            code = ""
     if code is None:
-        print(
-            json.dumps(
-                {
-                    "status": "failed",
-                    "stdout": "",
-                    "stderr": f"entrypoint {entry} not found",
-                    "wall_ms": 0,
-                }
-            )
+        _emit(
+            {
+                "status": "failed",
+                "stdout": "",
+                "stderr": f"entrypoint {entry} not found",
+                "wall_ms": 0,
+            }
         )
         return
+    stdout = make_buffer("stdout")
+    stderr = make_buffer("stderr")
+    spans = _Spans()
+
+    def on_timeout(signum, frame):
+        # SIGTERM from the worker at the time limit: report what was captured
+        stderr.write("\nexecution timed out\n")
+        stdout.close()
+        stderr.close()
+        wall_ms = int((time.time() - start) * 1000)
+        _emit(_result("failed", stdout, stderr, wall_ms, spans))
+        os._exit(1)
+
+    signal.signal(signal.SIGTERM, on_timeout)
     if language == "python":
         # Execute by building an in-memory module namespace
         ns = {"__name__": "__main__"}
         try:
-            import types, builtins
+            import types
 
             module_cache = {}
 
@@ -55,82 +283,82 @@ def main():
                 exec(src, m.__dict__)
                 return m
 
-            real_print = print
-
-            def capture_print(*a, **k):
-                s = " ".join(str(x) for x in a)
-                stdout.append(s)
-
-            builtins.print = capture_print
-            exec(code, ns)
+            with spans.span("runner.exec"), contextlib.redirect_stdout(
+                _Stream(stdout)
+            ), contextlib.redirect_stderr(_Stream(stderr)):
+                exec(code, ns)
             status = "succeeded"
         except SystemExit:
             status = "succeeded"
         except Exception:
             status = "failed"
-            stderr.append(traceback.format_exc())
-        finally:
-            import builtins as _b
-
-            _b.print = real_print
+            stderr.write(traceback.format_exc())
     elif language == "javascript":
         # Execute via node if available
-        import subprocess, tempfile, os
+        import subprocess, tempfile, threading
 
         try:
-            with tempfile.TemporaryDirectory() as td:
-                # write all files
-                for p, src in files.items():
-                    fp = os.path.join(td, p)
-                    os.makedirs(os.path.dirname(fp), exist_ok=True)
-                    with open(fp, "w", encoding="utf-8") as f:
-                        f.write(src)
-                start_node = time.time()
-                proc = subprocess.Popen(
-                    ["node", entry],
-                    cwd=td,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                )
-                out, err = proc.communicate(timeout=10)
-                stdout.append(out.rstrip())
-                if err:
-                    stderr.append(err.rstrip())
+            if workdir:
+                run_dir = contextlib.nullcontext(workdir)
+            else:
+                run_dir = tempfile.TemporaryDirectory()
+            with run_dir as td:
+                if not workdir:
+                    # write all files
+                    with spans.span("runner.write_files"):
+                        for p, src in files.items():
+                            fp = os.path.join(td, p)
+                            os.makedirs(os.path.dirname(fp), exist_ok=True)
+                            with open(fp, "w", encoding="utf-8") as f:
+                                f.write(src)
+                with spans.span("runner.exec"):
+                    proc = subprocess.Popen(
+                        ["node", entry],
+                        cwd=td,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                    )
+                    # Drain both pipes into bounded buffers instead of communicate(),
+                    # which would hold the whole output in memory.
+                    pumps = [
+                        threading.Thread(target=_pump, args=(proc.stdout, stdout)),
+                        threading.Thread(target=_pump, args=(proc.stderr, stderr)),
+                    ]
+                    for t in pumps:
+                        t.start()
+                    try:
+                        proc.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+                        raise
+                    finally:
+                        for t in pumps:
+                            t.join()
                 status = "succeeded" if proc.returncode == 0 else "failed"
-                wall_ms = int((time.time() - start) * 1000)
         except FileNotFoundError:
             status = "failed"
-            stderr.append("node runtime not installed in container")
+            stderr.write("node runtime not installed in container")
         except subprocess.TimeoutExpired:
             status = "failed"
-            stderr.append("javascript execution timed out")
+            stderr.write("javascript execution timed out")
         except Exception:
             status = "failed"
-            stderr.append(traceback.format_exc())
+            stderr.write(traceback.format_exc())
     else:
-        print(
-            json.dumps(
-                {
-                    "status": "failed",
-                    "stdout": "",
-                    "stderr": f"unsupported language {language}",
-                    "wall_ms": 0,
-                }
-            )
-        )
-        return
-    wall_ms = int((time.time() - start) * 1000)
-    print(
-        json.dumps(
+        _emit(
             {
-                "status": status,
-                "stdout": "\n".join(stdout),
-                "stderr": "\n".join(stderr),
-                "wall_ms": wall_ms,
+                "status": "failed",
+                "stdout": "",
+                "stderr": f"unsupported language {language}",
+                "wall_ms": 0,
             }
         )
-    )
+        return
+    stdout.close()
+    stderr.close()
+    wall_ms = int((time.time() - start) * 1000)
+    _emit(_result(status, stdout, stderr, wall_ms, spans))
 
 
 if __name__ == "__main__":
@@ -22,3 +22,23 @@ class FileOut(BaseModel):
     id: str
     path: str
     content: str
+
+
+class ImportReport(BaseModel):
+    imported: int
+    skipped: int
+    # first skipped member names: binary, oversized, links, unsafe paths
+    skipped_paths: list[str]
+
+
+class SearchMatch(BaseModel):
+    path: str
+    line: int
+    text: str
+    # [start, end) columns of each match within `text`
+    ranges: list[tuple[int, int]]
+
+
+class SearchPage(BaseModel):
+    items: list[SearchMatch]
+    next_cursor: str | None = None
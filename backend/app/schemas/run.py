@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
 from app.db.enums import RunStatus
 
@@ -5,6 +6,18 @@ from app.db.enums import RunStatus
 class RunCreate(BaseModel):
     entrypoint: str
     language: str = Field(default="python")
+    # Run in the project's warm kernel (python only), keeping state between runs
+    session: bool = False
+    reset_session: bool = False  # discard that state first
+    # Reuse the result of an identical earlier run (same files and runtime)
+    deterministic: bool = False
+
+
+class RunTimeline(BaseModel):
+    trace_id: str
+    start_ms: float  # epoch milliseconds
+    # [name, start offset ms, duration ms], in the order stages finished
+    spans: list[tuple[str, float, float]]
 
 
 class RunOut(BaseModel):
@@ -15,3 +28,24 @@ class RunOut(BaseModel):
     stdout: str | None = None
     stderr: str | None = None
     wall_ms: int | None = None
+    stdout_bytes: int | None = None
+    stderr_bytes: int | None = None
+    output_truncated: bool = False
+    output_archived: bool = False  # read output via /runs/{id}/output
+    timeline: RunTimeline | None = None
+    created_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+class RunPage(BaseModel):
+    items: list[RunOut]
+    next_cursor: str | None = None  # pass back as ?cursor= for the next page
+
+
+class RunOutputPage(BaseModel):
+    run_id: str
+    stream: str
+    offset: int
+    data: str
+    next_offset: int | None = None  # None once the end is reached
+    total_bytes: int
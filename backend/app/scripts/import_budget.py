@@ -0,0 +1,112 @@
+"""Fail if importing the API or worker entry module got slower than a budget,
+or if it pulls in modules that should only load on first use.
+
+    python -m app.scripts.import_budget              # both, default budgets
+    python -m app.scripts.import_budget --api-ms 900 --worker-ms 600
+
+Each import runs in a fresh interpreter several times and the fastest run
+counts, which filters out noise from a busy machine. On failure the
+slowest imports (from `-X importtime`) are listed.
+"""
+
+import argparse, json, os, subprocess, sys
+
+# Loaded lazily (AI client, tokenizer, DB driver) or not at all by the
+# services; importing any of them at startup is a regression.
+NEVER_AT_IMPORT = (
+    "pandas",
+    "numpy",
+    "nltk",
+    "nbconvert",
+    "openai",
+    "tiktoken",
+    "asyncpg",
+)
+TARGETS = {
+    "api": ("app.main", NEVER_AT_IMPORT),
+    "worker": (
+        "app.worker.consumer",
+        NEVER_AT_IMPORT + ("fastapi", "starlette", "uvicorn", "jose", "passlib"),
+    ),
+}
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({{"ms": ms, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _backend_dir() -> str:
+    here = os.path.abspath(__file__)  # backend/app/scripts/import_budget.py
+    return os.path.dirname(os.path.dirname(os.path.dirname(here)))
+
+
+def measure(module: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=_backend_dir(),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, n: int = 15) -> list[tuple[int, str]]:
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_backend_dir(),
+        capture_output=True,
+        text=True,
+    ).stderr
+    rows = []
+    for line in err.splitlines():
+        # "import time: <self us> | <cumulative us> | <name>"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def check(name: str, budget_ms: float, runs: int) -> bool:
+    module, forbidden = TARGETS[name]
+    results = [measure(module) for _ in range(runs)]
+    best = min(r["ms"] for r in results)
+    loaded = sorted(m for m in forbidden if m in results[0]["modules"])
+    ok = best <= budget_ms and not loaded
+    print(
+        f"{'ok  ' if ok else 'FAIL'} {name:<7} import {module}: "
+        f"{best:.0f}ms (budget {budget_ms:.0f}ms)"
+    )
+    if loaded:
+        print(f"     loaded at import time: {', '.join(loaded)}")
+    if best > budget_ms:
+        for us, mod in slowest_imports(module):
+            print(f"     {us / 1000:8.1f}ms {mod}")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Import-time budget check")
+    ap.add_argument(
+        "--api-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_API_MS", 1000))
+    )
+    ap.add_argument(
+        "--worker-ms",
+        type=float,
+        default=float(os.getenv("IMPORT_BUDGET_WORKER_MS", 800)),
+    )
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--only", choices=sorted(TARGETS))
+    args = ap.parse_args()
+
+    budgets = {"api": args.api_ms, "worker": args.worker_ms}
+    names = [args.only] if args.only else list(TARGETS)
+    ok = all([check(n, budgets[n], args.runs) for n in names])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
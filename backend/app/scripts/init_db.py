@@ -1,11 +1,53 @@
 import asyncio
-from app.db.session import engine
+from datetime import datetime, timezone
+from sqlalchemy import inspect, text
+from app.core.config import get_settings
+from app.db.session import get_engine
 from app.db.models import Base
+from app.db.partitions import ensure_run_partitions, runs_is_partitioned
+
+# create_all() never alters existing tables; columns added since the first
+# release are backfilled here (Postgres only, idempotent).
+UPGRADES = [
+    "ALTER TABLE runs ADD COLUMN IF NOT EXISTS stdout_bytes INTEGER",
+    "ALTER TABLE runs ADD COLUMN IF NOT EXISTS stderr_bytes INTEGER",
+    "ALTER TABLE runs ADD COLUMN IF NOT EXISTS output_truncated BOOLEAN NOT NULL DEFAULT false",
+    "ALTER TABLE runs ADD COLUMN IF NOT EXISTS output_key VARCHAR",
+    "ALTER TABLE runs ADD COLUMN IF NOT EXISTS output_archived BOOLEAN NOT NULL DEFAULT false",
+    "ALTER TABLE runs ADD COLUMN IF NOT EXISTS timeline JSON",
+    "CREATE INDEX IF NOT EXISTS ix_runs_project_created_id"
+    " ON runs (project_id, created_at, id)",
+    # covered by ix_runs_project_created_id; only cost writes
+    "DROP INDEX IF EXISTS ix_runs_project_id",
+    "CREATE INDEX IF NOT EXISTS ix_files_content_trgm"
+    " ON files USING gin (content gin_trgm_ops)",
+]
 
 
 async def main():
-    async with engine.begin() as conn:
+    settings = get_settings()
+    async with get_engine().begin() as conn:
+        fresh = not await conn.run_sync(lambda c: inspect(c).has_table("runs"))
+        if conn.dialect.name == "postgresql":
+            # code search index (ix_files_content_trgm)
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        # On Postgres a fresh `runs` is created PARTITION BY RANGE (created_at)
         await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == "postgresql":
+            for stmt in UPGRADES:
+                await conn.execute(text(stmt))
+            if await runs_is_partitioned(conn):
+                await ensure_run_partitions(
+                    conn,
+                    datetime.now(timezone.utc),
+                    months_back=1,
+                    months_ahead=settings.RUN_PARTITION_MONTHS_AHEAD,
+                )
+            elif not fresh:
+                print(
+                    "runs predates partitioning; retention falls back to DELETE."
+                    " Recreate the table to partition it."
+                )
     print("DB schema created (or already exists)")
 
 
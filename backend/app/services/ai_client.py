@@ -0,0 +1,21 @@
+from app.core.config import get_settings
+
+settings = get_settings()
+_clients: dict = {}
+
+
+def get_ai_client(api_key: str):
+    """Shared AsyncOpenAI client per API key; openai is imported on first use."""
+    client = _clients.get(api_key)
+    if client is None:
+        from openai import AsyncOpenAI
+
+        client = AsyncOpenAI(api_key=api_key, base_url=settings.OPENAI_BASE_URL)
+        _clients[api_key] = client
+    return client
+
+
+async def close_ai_clients():
+    while _clients:
+        _, client = _clients.popitem()
+        await client.close()
@@ -0,0 +1,359 @@
+import hashlib, logging, posixpath, re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+log = logging.getLogger("ai")
+
+CURSOR_MARK = "<cursor>"
+
+# Share of the budget reserved for the cursor window; whatever it leaves
+# unused flows to related-file snippets (and vice versa).
+WINDOW_SHARE = 0.6
+# Of the window budget, the part spent on lines before the cursor.
+BEFORE_SHARE = 0.7
+# Hard cap per related file so one large module can't crowd out the rest.
+MAX_FILE_SHARE = 0.5
+
+_PY_IMPORT = re.compile(r"^\s*import\s+([\w., ]+)", re.M)
+_PY_FROM = re.compile(r"^\s*from\s+(\.*[\w.]*)\s+import\s+([\w*, ()]+)", re.M)
+_JS_IMPORT = re.compile(
+    r"""(?:import\s[^'"]*?from\s*|import\s*\(\s*|require\s*\(\s*|import\s+)['"]([^'"]+)['"]"""
+)
+_PY_SYMBOL = re.compile(r"^(?:async\s+def|def|class)\s+(\w+)")
+_JS_SYMBOL = re.compile(
+    r"^(?:export\s+)?(?:default\s+)?(?:async\s+)?"
+    r"(?:function\*?\s+(\w+)|class\s+(\w+)|(?:const|let|var)\s+(\w+)\s*=)"
+)
+_IDENT = re.compile(r"[A-Za-z_]\w*")
+_JS_EXTS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:  # not installed or BPE files unavailable offline
+        log.debug("tiktoken unavailable, estimating tokens: %s", e)
+        return None
+
+
+@lru_cache(maxsize=65536)
+def line_tokens(line: str) -> int:
+    """Token count of one line plus its newline; cached by line text so the
+    current buffer only pays for lines edited since the last keystroke."""
+    enc = _encoding()
+    if enc is None:
+        return len(line) // 4 + 1
+    return len(enc.encode_ordinary(line + "\n"))
+
+
+def count_tokens(text: str) -> int:
+    return sum(line_tokens(l) for l in text.split("\n"))
+
+
+@dataclass
+class Symbol:
+    name: str
+    start: int  # 0-based line index
+    end: int  # exclusive
+
+
+@dataclass
+class FileInfo:
+    lines: list[str]
+    line_tokens: list[int]
+    symbols: list[Symbol] = field(default_factory=list)
+    imports: list[str] = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        return sum(self.line_tokens)
+
+
+def _is_js(path: str) -> bool:
+    return path.endswith(_JS_EXTS)
+
+
+def _file_header(path: str) -> str:
+    return ("// file: " if _is_js(path) else "# file: ") + path
+
+
+def _extract_symbols(path: str, lines: list[str]) -> list[Symbol]:
+    pat = _JS_SYMBOL if _is_js(path) else _PY_SYMBOL
+    starts = []
+    for i, line in enumerate(lines):
+        # top level only: nested defs are covered by their parent's block
+        if not line or line[0] in " \t":
+            continue
+        m = pat.match(line)
+        if m:
+            starts.append((i, next(g for g in m.groups() if g)))
+    symbols = []
+    for n, (i, name) in enumerate(starts):
+        end = starts[n + 1][0] if n + 1 < len(starts) else len(lines)
+        while end > i + 1 and not lines[end - 1].strip():
+            end -= 1
+        symbols.append(Symbol(name, i, end))
+    return symbols
+
+
+def extract_imports(path: str, text: str) -> list[str]:
+    if _is_js(path):
+        return _JS_IMPORT.findall(text)
+    mods = []
+    for m in _PY_IMPORT.finditer(text):
+        mods += [p.split(" as ")[0].strip() for p in m.group(1).split(",")]
+    for m in _PY_FROM.finditer(text):
+        base = m.group(1)
+        mods.append(base)
+        # `from pkg import mod` may name a submodule rather than a symbol
+        for name in m.group(2).strip("() ").split(","):
+            name = name.split(" as ")[0].strip()
+            if name and name != "*":
+                mods.append(base + ("" if base.endswith(".") else ".") + name)
+    return [m for m in mods if m]
+
+
+class FileInfoCache:
+    """LRU of tokenization + symbol/import extraction keyed by content hash."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], FileInfo] = OrderedDict()
+
+    def get(self, path: str, content: str) -> FileInfo:
+        key = (path, hashlib.sha1(content.encode()).hexdigest())
+        info = self._entries.get(key)
+        if info is not None:
+            self._entries.move_to_end(key)
+            return info
+        lines = content.split("\n")
+        info = FileInfo(
+            lines=lines,
+            line_tokens=[line_tokens(l) for l in lines],
+            symbols=_extract_symbols(path, lines),
+            imports=extract_imports(path, content),
+        )
+        self._entries[key] = info
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return info
+
+
+_cache = FileInfoCache()
+
+
+class ImportIndex:
+    """Imports of every file of recently used projects.
+
+    Entries are keyed by a file version (id, updated_at) read from
+    the DB, so each request only re-reads and re-parses files that changed
+    since the last one; paths that are gone simply aren't asked for.
+    """
+
+    def __init__(self, max_projects: int = 64):
+        self.max_projects = max_projects
+        # project -> path -> (version, imports)
+        self._projects: OrderedDict[str, dict[str, tuple]] = OrderedDict()
+
+    def stale(self, project_id: str, versions: dict[str, tuple]) -> list[str]:
+        known = self._projects.get(project_id, {})
+        return [p for p, v in versions.items() if p not in known or known[p][0] != v]
+
+    def update(
+        self, project_id: str, versions: dict[str, tuple], contents: dict[str, str]
+    ) -> dict[str, list[str]]:
+        """Record re-read `contents`; returns path -> imports of `versions`."""
+        known = self._projects.pop(project_id, {})
+        known = {p: known[p] for p in versions if p in known}
+        for p, content in contents.items():
+            known[p] = (versions[p], extract_imports(p, content))
+        self._projects[project_id] = known
+        while len(self._projects) > self.max_projects:
+            self._projects.popitem(last=False)
+        return {p: imports for p, (_, imports) in known.items()}
+
+    def invalidate(self, project_id: str):
+        self._projects.pop(project_id, None)
+
+
+imports_index = ImportIndex()
+
+
+def _resolve_import(spec: str, path: str, files: dict[str, str]) -> list[str]:
+    here = posixpath.dirname(path)
+    if _is_js(path):
+        if not spec.startswith("."):
+            return []  # package import, nothing in the project to show
+        base = posixpath.normpath(posixpath.join(here, spec))
+        candidates = [base] + [base + e for e in _JS_EXTS]
+        candidates += [posixpath.join(base, "index" + e) for e in _JS_EXTS]
+        return [c for c in candidates if c in files][:1]
+    dots = len(spec) - len(spec.lstrip("."))
+    rel = spec[dots:].replace(".", "/")
+    if dots:
+        root = here
+        for _ in range(dots - 1):
+            root = posixpath.dirname(root)
+        roots = [root]
+    else:
+        roots = ["", here] if here else [""]
+    found = []
+    for root in roots:
+        base = posixpath.join(root, rel) if rel else root
+        for c in (base + ".py", posixpath.join(base, "__init__.py")):
+            c = c.lstrip("/")
+            if c in files and c not in found:
+                found.append(c)
+    return found[:1]
+
+
+def related_paths(
+    path: str, imports: list[str], project_imports: dict[str, list[str]]
+) -> list[str]:
+    """Imported modules first, then files importing the current one, then
+    siblings with the same extension. `project_imports` maps every project
+    path to its imports; no file contents are needed."""
+    ordered: dict[str, None] = {}  # insertion-ordered set
+
+    def add(p):
+        if p != path:
+            ordered.setdefault(p)
+
+    for spec in imports:
+        for p in _resolve_import(spec, path, project_imports):
+            add(p)
+    ext = posixpath.splitext(path)[1]
+    for p, specs in project_imports.items():
+        if p == path or posixpath.splitext(p)[1] != ext:
+            continue
+        if any(path in _resolve_import(s, p, project_imports) for s in specs):
+            add(p)
+    here = posixpath.dirname(path)
+    for p in sorted(project_imports):
+        if posixpath.dirname(p) == here and posixpath.splitext(p)[1] == ext:
+            add(p)
+    return list(ordered)
+
+
+def _related_files(path: str, info: FileInfo, files: dict[str, str]) -> list[str]:
+    project_imports = {p: _cache.get(p, c).imports for p, c in files.items()}
+    return related_paths(path, info.imports, project_imports)
+
+
+def _split_at_cursor(req_content: str, line: int, col: int) -> tuple[str, str]:
+    lines = req_content.split("\n")
+    idx = max(0, min(line - 1, len(lines) - 1))
+    cur = lines[idx]
+    c = max(0, min(col - 1, len(cur)))
+    before = "\n".join(lines[:idx] + [cur[:c]])
+    after = "\n".join([cur[c:]] + lines[idx + 1 :])
+    return before, after
+
+
+def _take_tail(text: str, budget: int) -> tuple[str, int]:
+    lines = text.split("\n")
+    used, i = 0, len(lines)
+    while i > 0 and used + line_tokens(lines[i - 1]) <= budget:
+        i -= 1
+        used += line_tokens(lines[i])
+    return "\n".join(lines[i:]), used
+
+
+def _take_head(text: str, budget: int) -> tuple[str, int]:
+    lines = text.split("\n")
+    used, i = 0, 0
+    while i < len(lines) and used + line_tokens(lines[i]) <= budget:
+        used += line_tokens(lines[i])
+        i += 1
+    return "\n".join(lines[:i]), used
+
+
+def _file_snippet(
+    path: str, info: FileInfo, wanted: set[str], budget: int
+) -> tuple[str, int]:
+    if info.tokens <= budget:
+        return "\n".join(info.lines), info.tokens
+    # Too big to inline: definitions referenced near the cursor in full,
+    # then the signature line of every other top-level symbol.
+    parts: list[tuple[int, str]] = []
+    used = 0
+    rest = []
+    for s in info.symbols:
+        cost = sum(info.line_tokens[s.start : s.end])
+        if s.name in wanted and used + cost <= budget:
+            parts.append((s.start, "\n".join(info.lines[s.start : s.end])))
+            used += cost
+        else:
+            rest.append(s)
+    for s in rest:
+        cost = info.line_tokens[s.start]
+        if used + cost > budget:
+            break
+        parts.append((s.start, info.lines[s.start].rstrip() + " ..."))
+        used += cost
+    parts.sort()
+    return "\n".join(p for _, p in parts), used
+
+
+def build_context(
+    path: str,
+    content: str,
+    cursor_line: int,
+    cursor_col: int,
+    files: dict[str, str] | None = None,
+    budget: int = 1536,
+    prefix: str | None = None,
+    suffix: str | None = None,
+) -> str:
+    """Assemble the user prompt: snippets of related project files followed by
+    the current file around the cursor, filling at most `budget` tokens."""
+    before, after = _split_at_cursor(content, cursor_line, cursor_col)
+    if prefix is not None:
+        before = prefix
+    if suffix is not None:
+        after = suffix
+
+    window_budget = int(budget * WINDOW_SHARE)
+    before_txt, used_before = _take_tail(before, int(window_budget * BEFORE_SHARE))
+    after_txt, used_after = _take_head(after, window_budget - used_before)
+    remaining = budget - used_before - used_after
+
+    files = dict(files or {})
+    files[path] = content
+    info = _cache.get(path, content)
+    snippets = []
+    if remaining > 0 and len(files) > 1:
+        wanted = set(_IDENT.findall(before_txt[-2000:] + after_txt[:500]))
+        per_file = max(1, int(budget * MAX_FILE_SHARE))
+        for rel in _related_files(path, info, files):
+            header = _file_header(rel)
+            cost = line_tokens(header)
+            if remaining - cost <= 0:
+                break
+            text, used = _file_snippet(
+                rel,
+                _cache.get(rel, files[rel]),
+                wanted,
+                min(per_file, remaining - cost),
+            )
+            if not text:
+                continue
+            snippets.append(header + "\n" + text)
+            remaining -= used + cost
+
+    # Give budget the related files didn't use back to the window.
+    if remaining > 0 and len(before_txt) < len(before):
+        before_txt, extra = _take_tail(before, used_before + remaining)
+        remaining -= extra - used_before
+    if remaining > 0 and len(after_txt) < len(after):
+        after_txt, _ = _take_head(after, used_after + remaining)
+
+    current = f"{_file_header(path)}\n{before_txt}{CURSOR_MARK}{after_txt}"
+    return "\n\n".join(snippets + [current])
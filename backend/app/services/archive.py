@@ -0,0 +1,232 @@
+import asyncio, io, posixpath, tarfile, time, zipfile
+from typing import AsyncIterator, Iterator
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import get_settings
+from app.db.models import File
+from app.db.session import get_sessionmaker
+from app.services.ai_context import imports_index
+
+settings = get_settings()
+FORMATS = {"tar.gz": "application/gzip", "zip": "application/zip"}
+_CHUNK = 500  # files per export read / import INSERT
+_CHUNK_BYTES = 8 * 1024 * 1024  # ...or fewer, once their content reaches this
+_MAX_SKIPPED = 100  # skipped paths listed in the import report
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class ArchiveTooLarge(ArchiveError):
+    pass
+
+
+class _Sink:
+    """Write-only file object; `drain` hands out what was written so far."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _mtime(f) -> float:
+    return f.updated_at.timestamp() if f.updated_at else time.time()
+
+
+class _TarWriter:
+    def __init__(self, sink: _Sink):
+        self.tf = tarfile.open(fileobj=sink, mode="w|gz")
+
+    def add(self, path: str, data: bytes, mtime: float):
+        ti = tarfile.TarInfo(path)
+        ti.size, ti.mtime, ti.mode = len(data), int(mtime), 0o644
+        self.tf.addfile(ti, io.BytesIO(data))
+
+    def close(self):
+        self.tf.close()
+
+
+class _ZipWriter:
+    def __init__(self, sink: _Sink):
+        # the sink can't seek, so entries get data descriptors
+        self.zf = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, path: str, data: bytes, mtime: float):
+        zi = zipfile.ZipInfo(path, time.localtime(mtime)[:6])
+        zi.compress_type = zipfile.ZIP_DEFLATED
+        zi.external_attr = 0o644 << 16
+        self.zf.writestr(zi, data)
+
+    def close(self):
+        self.zf.close()
+
+
+async def export_project(project_id: str, fmt: str) -> AsyncIterator[bytes]:
+    """Stream a project's files as an archive.
+
+    Rows come from a server-side cursor `_CHUNK` at a time and are
+    compressed off the event loop; only the current chunk is held in
+    memory. Opens its own session since the response outlives the
+    request's.
+    """
+    sink = _Sink()
+    writer = _TarWriter(sink) if fmt == "tar.gz" else _ZipWriter(sink)
+
+    def add_all(rows):
+        for f in rows:
+            writer.add(f.path, f.content.encode(), _mtime(f))
+        return sink.drain()
+
+    async with get_sessionmaker()() as db:
+        stmt = (
+            select(File.path, File.content, File.updated_at)
+            .where(File.project_id == project_id)
+            .order_by(File.path)
+            .execution_options(yield_per=_CHUNK)
+        )
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            data = await asyncio.to_thread(add_all, rows)
+            if data:
+                yield data
+    await asyncio.to_thread(writer.close)
+    yield sink.drain()
+
+
+def clean_path(name: str, strip: int = 0) -> str | None:
+    """Archive member name -> project path, or None if it must be skipped."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if ".." in parts or len(parts) <= strip:
+        return None
+    path = posixpath.join(*parts[strip:])
+    return path if len(path) <= 1024 else None
+
+
+def _members(fileobj) -> Iterator[tuple[str, bytes | None]]:
+    """(name, data) of every archive member; data is None for members that
+    aren't regular files or exceed IMPORT_MAX_FILE_BYTES. Raises
+    ArchiveTooLarge before decompressing past IMPORT_MAX_TOTAL_BYTES."""
+    limit = settings.IMPORT_MAX_FILE_BYTES
+    total = 0
+
+    def take(size: int):
+        nonlocal total
+        total += size
+        if total > settings.IMPORT_MAX_TOTAL_BYTES:
+            raise ArchiveTooLarge(
+                f"more than {settings.IMPORT_MAX_TOTAL_BYTES} bytes uncompressed"
+            )
+
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    if head.startswith(b"PK\x03\x04") or head.startswith(b"PK\x05\x06"):
+        with zipfile.ZipFile(fileobj) as zf:
+            for zi in zf.infolist():
+                if zi.is_dir():
+                    continue
+                if zi.file_size > limit:
+                    yield zi.filename, None
+                    continue
+                take(zi.file_size)
+                yield zi.filename, zf.read(zi)
+        return
+    # transparent compression, read sequentially (no seeking back)
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+        for ti in tf:
+            if ti.isdir():
+                continue
+            if not ti.isfile() or ti.size > limit:
+                yield ti.name, None
+                continue
+            take(ti.size)
+            yield ti.name, tf.extractfile(ti).read()
+
+
+def _next_chunk(members: Iterator, strip: int, seen: set, report: dict) -> dict:
+    """Up to `_CHUNK` decoded files (`_CHUNK_BYTES` of content), keyed by
+    project path."""
+    chunk: dict[str, str] = {}
+    size = 0
+    for name, data in members:
+        path = clean_path(name, strip)
+        text = None
+        if path is not None and data is not None:
+            try:
+                text = data.decode("utf-8")
+            except UnicodeDecodeError:
+                pass  # binary files can't be stored as text
+        if text is None or "\x00" in text:
+            report["skipped"] += 1
+            if len(report["skipped_paths"]) < _MAX_SKIPPED:
+                report["skipped_paths"].append(name)
+            continue
+        if path not in seen and len(seen) >= settings.IMPORT_MAX_FILES:
+            raise ArchiveError(f"more than {settings.IMPORT_MAX_FILES} files")
+        seen.add(path)
+        chunk[path] = text
+        size += len(data)
+        if len(chunk) >= _CHUNK or size >= _CHUNK_BYTES:
+            break
+    return chunk
+
+
+async def import_archive(
+    db: AsyncSession,
+    project_id: str,
+    fileobj,
+    strip: int = 0,
+    replace: bool = False,
+) -> dict:
+    """Load a zip or (compressed) tar into a project in one transaction.
+
+    Members are parsed off the event loop `_CHUNK` files at a time; each
+    chunk replaces files with the same paths via one DELETE and one
+    multi-row INSERT. With `replace` the project's other files go too.
+    """
+    report = {"imported": 0, "skipped": 0, "skipped_paths": []}
+    seen: set[str] = set()
+    # with `replace`, the project is emptied only once the first chunk was
+    # read; a later failure rolls the DELETE back with everything else
+    empty_first = replace
+    try:
+        members = _members(fileobj)
+        while chunk := await asyncio.to_thread(
+            _next_chunk, members, strip, seen, report
+        ):
+            where = [File.project_id == project_id]
+            if not empty_first:
+                # also covers a path repeated in an earlier chunk
+                where.append(File.path.in_(list(chunk)))
+            await db.execute(delete(File).where(*where))
+            empty_first = False
+            await db.execute(
+                insert(File),
+                [
+                    {"project_id": project_id, "path": p, "content": c}
+                    for p, c in chunk.items()
+                ],
+            )
+            report["imported"] = len(seen)
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError, OSError) as e:
+        await db.rollback()
+        raise ArchiveError(f"unreadable archive: {e}")
+    except ArchiveError:
+        await db.rollback()
+        raise
+    if empty_first:  # an empty archive replaces everything too
+        await db.execute(delete(File).where(File.project_id == project_id))
+    await db.commit()
+    # every file is new; single writes are caught by the version keys
+    imports_index.invalidate(project_id)
+    return report
@@ -0,0 +1,53 @@
+import os, shutil
+from functools import lru_cache
+from app.core.config import get_settings
+
+
+class LocalBlobStore:
+    """Key/value blob storage on a directory shared by the API and workers.
+
+    Keys are relative, `/`-separated paths (e.g. `runs/<id>/stdout.gz`).
+    Calls are blocking; run them via `asyncio.to_thread` on hot paths.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"invalid blob key {key!r}")
+        return path
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def put_file(self, key: str, src: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, path)
+
+    def open(self, key: str):
+        return open(self._path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def delete_prefix(self, prefix: str):
+        path = self._path(prefix)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+@lru_cache
+def get_blob_store() -> LocalBlobStore:
+    return LocalBlobStore(get_settings().BLOB_DIR)
@@ -2,8 +2,33 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.db.models import File
 
+_IN_CHUNK = 500  # paths per IN (...) lookup
+
 
 async def list_project_files(db: AsyncSession, project_id: str) -> dict[str, str]:
     res = await db.execute(select(File).where(File.project_id == project_id))
     files = res.scalars().all()
     return {f.path: f.content for f in files}
+
+
+async def file_versions(db: AsyncSession, project_id: str) -> dict[str, tuple]:
+    """path -> (id, updated_at) of a project's files. Reads no contents: on
+    Postgres even length(content) would detoast every file."""
+    res = await db.execute(
+        select(File.path, File.id, File.updated_at).where(File.project_id == project_id)
+    )
+    return {path: tuple(version) for path, *version in res.all()}
+
+
+async def read_files(
+    db: AsyncSession, project_id: str, paths: list[str]
+) -> dict[str, str]:
+    files: dict[str, str] = {}
+    for i in range(0, len(paths), _IN_CHUNK):
+        res = await db.execute(
+            select(File.path, File.content).where(
+                File.project_id == project_id, File.path.in_(paths[i : i + _IN_CHUNK])
+            )
+        )
+        files.update(res.all())
+    return files
@@ -0,0 +1,120 @@
+"""Result cache for runs started with `deterministic=true`.
+
+A result is stored under its project, the project's cache generation, a
+hash of (file contents, language, entrypoint) and the runtime version that
+produced it. Entries expire `MEMO_TTL_S` after their last use; an index
+sorted by last use keeps at most `MEMO_MAX_ENTRIES` of them, each at most
+`MEMO_MAX_ENTRY_BYTES`. Bumping a project's generation invalidates all of
+its entries at once.
+"""
+
+import asyncio, hashlib, logging, platform, time
+from app.core import metrics
+from app.core.config import get_settings
+from app.core.fastjson import dumps, loads
+from app.queues.redis import MEMO_PREFIX
+
+settings = get_settings()
+log = logging.getLogger("memo")
+INDEX_KEY = MEMO_PREFIX + "index"
+# runtime versions the API looks results up for: the last worker started
+RUNTIMES_KEY = MEMO_PREFIX + "runtimes"
+# ...and those of this worker process, which results are stored for
+_runtimes: dict[str, str] = {}
+# result fields replayed on a hit
+FIELDS = ("status", "stdout", "stderr", "wall_ms", "stdout_bytes", "stderr_bytes")
+
+
+def _gen_key(project_id: str) -> str:
+    return f"{MEMO_PREFIX}gen:{project_id}"
+
+
+def content_hash(files: dict[str, str]) -> str:
+    h = hashlib.sha256()
+    for path in sorted(files):
+        for part in (path, files[path]):
+            data = part.encode()
+            h.update(len(data).to_bytes(8, "big"))
+            h.update(data)
+    return h.hexdigest()
+
+
+async def memo_key(
+    r, project_id: str, language: str, entrypoint: str, files: dict[str, str]
+) -> str | None:
+    """Cache key of this run, or None while no worker reported the runtime
+    version of `language` (then the run is neither looked up nor stored).
+
+    The runtime version is the key's last component; during a rolling
+    deploy it may not be the one of the worker that runs the job, which
+    stores the result under its own (see `store`).
+    """
+    async with r.pipeline(transaction=False) as p:
+        p.get(_gen_key(project_id))
+        p.hget(RUNTIMES_KEY, language)
+        gen, runtime = await p.execute()
+    if runtime is None:
+        return None
+    parts = (content_hash(files), language, entrypoint)
+    digest = hashlib.sha256("\0".join(parts).encode()).hexdigest()
+    return f"{MEMO_PREFIX}{project_id}:{int(gen or 0)}:{digest}:{runtime.decode()}"
+
+
+async def lookup(r, key: str) -> dict | None:
+    # a hit restarts the entry's TTL, like its position in the index
+    data = await r.getex(key, ex=settings.MEMO_TTL_S)
+    metrics.RUN_MEMO.labels("hit" if data else "miss").inc()
+    if data is None:
+        return None
+    await r.zadd(INDEX_KEY, {key: time.time()})
+    return loads(data)
+
+
+async def store(r, key: str, language: str, result: dict):
+    """Cache a finished run's result under `key` with this worker's runtime
+    version; only complete, successful output is kept (spilled output
+    belongs to the original run)."""
+    if result.get("status") != "succeeded" or result.get("truncated"):
+        return
+    if language not in _runtimes:
+        return
+    key = f"{key.rsplit(':', 1)[0]}:{_runtimes[language]}"
+    data = dumps({f: result.get(f) for f in FIELDS})
+    if len(data) > settings.MEMO_MAX_ENTRY_BYTES:
+        metrics.RUN_MEMO.labels("too_large").inc()
+        return
+    async with r.pipeline(transaction=False) as p:
+        p.set(key, data, ex=settings.MEMO_TTL_S)
+        p.zadd(INDEX_KEY, {key: time.time()})
+        # expired entries age out of the index as well
+        p.zremrangebyscore(INDEX_KEY, 0, time.time() - settings.MEMO_TTL_S)
+        p.zcard(INDEX_KEY)
+        *_, size = await p.execute()
+    metrics.RUN_MEMO.labels("stored").inc()
+    excess = size - settings.MEMO_MAX_ENTRIES
+    if excess > 0:
+        evicted = [k for k, _ in await r.zpopmin(INDEX_KEY, excess)]
+        await r.delete(*evicted)
+        metrics.RUN_MEMO.labels("evicted").inc(len(evicted))
+
+
+async def invalidate(r, project_id: str) -> int:
+    """Drop every cached result of a project; returns the new generation."""
+    return await r.incr(_gen_key(project_id))
+
+
+async def publish_runtimes(r):
+    """Record this worker's runtime versions: the results it stores are keyed
+    by them, and the API looks up the versions published last."""
+    runtimes = {"python": platform.python_version()}
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "node", "--version", stdout=asyncio.subprocess.PIPE
+        )
+        out, _ = await proc.communicate()
+        if proc.returncode == 0:
+            runtimes["javascript"] = out.decode().strip()
+    except OSError:
+        log.info("node not found; javascript runs won't be memoized")
+    _runtimes.update(runtimes)
+    await r.hset(RUNTIMES_KEY, mapping=runtimes)
@@ -0,0 +1,97 @@
+import gzip, os
+from app.db.models import Run
+from app.services.blobs import get_blob_store
+
+STREAMS = ("stdout", "stderr")
+
+
+def store_spill(run_id: str, spill_dir: str) -> str:
+    """Copy the runner's compressed spill files into the blob store and return
+    the key prefix to record on the run."""
+    store = get_blob_store()
+    prefix = f"runs/{run_id}"
+    for name in STREAMS:
+        for suffix in (".gz", ".gz.idx"):
+            src = os.path.join(spill_dir, name + suffix)
+            if os.path.exists(src):
+                store.put_file(f"{prefix}/{name}{suffix}", src)
+    return prefix
+
+
+def _read_gzip(store, key: str, offset: int, n: int) -> bytes:
+    """Up to `n` uncompressed bytes of blob `key` from `offset`.
+
+    Chunked spills (see `ChunkedGzipWriter`) are read from the member
+    holding `offset`, so a page costs about a page plus one chunk. Blobs
+    without an index (archived inline output, bounded by head + tail) are
+    decompressed from the start.
+    """
+    if not store.exists(key + ".idx"):
+        with store.open(key) as raw, gzip.GzipFile(fileobj=raw) as gz:
+            gz.seek(offset)
+            return gz.read(n)
+    with store.open(key + ".idx") as f:
+        idx = f.read()
+    chunk = int.from_bytes(idx[:8], "big")
+    starts = [int.from_bytes(idx[i : i + 8], "big") for i in range(8, len(idx), 8)]
+    k = offset // chunk
+    skip = offset - k * chunk
+    data = bytearray()
+    with store.open(key) as raw:
+        if k < len(starts):
+            raw.seek(starts[k])
+        while k < len(starts) and len(data) < skip + n:
+            size = starts[k + 1] - starts[k] if k + 1 < len(starts) else -1
+            data += gzip.decompress(raw.read(size))
+            k += 1
+    return bytes(data[skip : skip + n])
+
+
+def _utf8_cut(data: bytes) -> int:
+    """Length of `data` without a trailing incomplete UTF-8 sequence, so
+    consecutive pages concatenate cleanly."""
+    for back in range(1, min(4, len(data)) + 1):
+        b = data[-back]
+        if b & 0xC0 == 0x80:  # continuation byte, keep looking for the lead
+            continue
+        if b & 0xE0 == 0xC0:
+            need = 2
+        elif b & 0xF0 == 0xE0:
+            need = 3
+        elif b & 0xF8 == 0xF0:
+            need = 4
+        else:
+            need = 1
+        return len(data) - back if need > back else len(data)
+    return len(data)
+
+
+def read_output_page(run: Run, stream: str, offset: int, limit: int) -> dict:
+    """Read `limit` (>= 4) bytes of a run's output stream starting at byte
+    `offset`.
+
+    Spilled output is read from the compressed blob; otherwise the inline
+    column already holds the complete stream. Blocking (gzip + file I/O).
+    """
+    total = getattr(run, f"{stream}_bytes")
+    key = f"{run.output_key}/{stream}.gz" if run.output_key else None
+    store = get_blob_store()
+    if key and store.exists(key):
+        data = _read_gzip(store, key, offset, limit + 1)
+    else:
+        inline = (getattr(run, stream) or "").encode()
+        data = inline[offset : offset + limit + 1]
+        if total is None:
+            total = len(inline)
+    more = len(data) > limit
+    data = data[:limit]
+    if more:
+        data = data[: _utf8_cut(data)]
+    return {
+        "run_id": run.id,
+        "stream": stream,
+        "offset": offset,
+        "data": data.decode("utf-8", "replace"),
+        "next_offset": offset + len(data) if more else None,
+        "total_bytes": total or 0,
+    }
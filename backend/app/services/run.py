@@ -1,11 +1,17 @@
-import io, tarfile, json, time
-from datetime import datetime
+import io, tarfile, time
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select
 from app.db.models import Run, File
-from app.db.enums import RunStatus
 from app.core.config import get_settings
-from app.queues.redis import get_redis, RUN_STREAM, SNAP_PREFIX
+from app.core.fastjson import dumps
+from app.core.tracing import Timeline
+from app.queues.redis import (
+    get_redis,
+    shard_stream,
+    SNAP_PREFIX,
+    EVENT_PREFIX,
+    LAST_EVENT_PREFIX,
+)
 
 settings = get_settings()
 
@@ -21,39 +27,50 @@ def make_snapshot(files: dict[str, str]) -> bytes:
     return buf.getvalue()
 
 
-async def enqueue_run(db: AsyncSession, run: Run, files: dict[str, str]):
-    snap = make_snapshot(files)
+async def enqueue_run(
+    db: AsyncSession,
+    run: Run,
+    files: dict[str, str],
+    timeline: Timeline | None = None,
+    session: bool = False,
+    reset_session: bool = False,
+    memo_key: str | None = None,
+):
+    timeline = timeline or Timeline()
+    with timeline.span("api.snapshot"):
+        snap = make_snapshot(files)
     snap_key = f"{SNAP_PREFIX}{run.id}"
     async with get_redis() as r:
-        await r.setex(snap_key, settings.SNAPSHOT_TTL_SECONDS, snap)
+        with timeline.span("api.snapshot_store"):
+            await r.setex(snap_key, settings.SNAPSHOT_TTL_SECONDS, snap)
+        # the stream entry id marks the enqueue time; the worker records
+        # the gap to pickup as queue_wait on the same timeline
         payload = {
             "run_id": run.id,
+            # partition key: the worker's completion UPDATE prunes by it
+            "created_at": run.created_at.isoformat(),
             "project_id": run.project_id,
             "language": run.language,
             "entrypoint": run.entrypoint,
             "snap_key": snap_key,
             "time_limit": settings.RUN_TIME_LIMIT_S,
+            "trace": timeline.to_dict(),
         }
-        await r.xadd(RUN_STREAM, {b"json": json.dumps(payload).encode()}, maxlen=1000)
+        if session:
+            payload["session"] = True
+            payload["reset_session"] = reset_session
+        if memo_key:
+            payload["memo_key"] = memo_key  # the worker stores the result
+        # all runs of a project go to one shard, so to one worker's caches
+        stream = shard_stream(run.project_id)
+        await r.xadd(stream, {b"json": dumps(payload)}, maxlen=1000)
 
 
-async def mark_run_done(
-    db: AsyncSession,
-    run_id: str,
-    status: RunStatus,
-    stdout: str,
-    stderr: str,
-    wall_ms: int,
-):
-    await db.execute(
-        update(Run)
-        .where(Run.id == run_id)
-        .values(
-            status=status.value,
-            stdout=stdout,
-            stderr=stderr,
-            wall_ms=wall_ms,
-            finished_at=datetime.utcnow(),
-        )
-    )
-    await db.commit()
+async def publish_event(r, run_id: str, event: dict):
+    """Publish a run event and keep it as the run's latest event, so a
+    WebSocket that subscribes after it was sent still receives it."""
+    data = dumps(event)
+    async with r.pipeline(transaction=False) as p:
+        p.set(LAST_EVENT_PREFIX + run_id, data, ex=settings.SNAPSHOT_TTL_SECONDS)
+        p.publish(EVENT_PREFIX + run_id, data)
+        await p.execute()
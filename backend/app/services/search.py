@@ -0,0 +1,194 @@
+import asyncio, base64, bisect, re, time
+import regex
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import get_settings
+from app.db.models import File
+
+settings = get_settings()
+MAX_LINE_CHARS = 500
+_BATCH = 200  # candidate files loaded per query
+_MIN_LITERAL = 3  # shorter strings have no trigrams to look up
+
+
+class SearchError(ValueError):
+    pass
+
+
+def encode_cursor(path: str, line: int) -> str:
+    return base64.urlsafe_b64encode(f"{line}|{path}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    try:
+        line, path = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return path, int(line)
+    except Exception:
+        raise SearchError("invalid cursor")
+
+
+def compile_query(q: str, is_regex: bool, case: bool) -> regex.Pattern:
+    # `regex` rather than `re`: its matching can be timed out, and releases
+    # the GIL while it runs (concurrent=True)
+    try:
+        return regex.compile(q if is_regex else regex.escape(q), 0 if case else regex.I)
+    except regex.error as e:
+        raise SearchError(f"invalid regex: {e}")
+
+
+def line_matches(
+    path: str,
+    content: str,
+    pattern: regex.Pattern,
+    after: int = 0,
+    timeout: float | None = None,
+):
+    """Yield one match dict per matching line numbered above `after`.
+
+    Raises TimeoutError once matching took `timeout` seconds in all.
+    """
+    starts = None  # line start offsets, computed on the first match
+    current = None
+    for m in pattern.finditer(content, concurrent=True, timeout=timeout):
+        if m.start() == m.end():
+            continue  # empty matches (e.g. `^`) carry no range
+        if starts is None:
+            starts = [0] + [nl.end() for nl in re.finditer("\n", content)]
+        n = bisect.bisect_right(starts, m.start())
+        if n <= after:
+            continue
+        if current is not None and current["line"] != n:
+            yield current
+            current = None
+        line_start = starts[n - 1]
+        if current is None:
+            end = starts[n] - 1 if n < len(starts) else len(content)
+            text = content[line_start:end].rstrip("\r")[:MAX_LINE_CHARS]
+            current = {"path": path, "line": n, "text": text, "ranges": []}
+        width = len(current["text"])
+        col = m.start() - line_start
+        if col < width:
+            current["ranges"].append([col, min(m.end() - line_start, width)])
+    if current is not None:
+        yield current
+
+
+def required_literal(q: str) -> str:
+    """Longest literal every match of regex `q` contains ("" if unsure).
+
+    A conservative scan, not a parse: alternation and inline flags give up,
+    groups, classes and escapes like \\d end a literal, and a character
+    followed by a quantifier that allows zero repeats is dropped from it.
+    """
+    if "|" in q or "(?" in q:
+        return ""
+    best, run, depth, i = "", [], 0, 0
+    while i < len(q):
+        c, i = q[i], i + 1
+        lit = None
+        if c == "\\":
+            c, i = q[i : i + 1], i + 1
+            if c and not c.isalnum():
+                lit = c  # escaped punctuation matches itself
+        elif c == "[":
+            # skip the class; a "]" first (after an optional "^") is a member
+            i += q[i : i + 1] == "^"
+            i += q[i : i + 1] == "]"
+            while i < len(q) and q[i] != "]":
+                i += 2 if q[i] == "\\" else 1
+            i += 1
+        elif c == "{":
+            if run:
+                run.pop()
+            i = q.find("}", i) + 1 or len(q)
+        elif c in "*?":
+            if run:
+                run.pop()
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c not in ".^$+":
+            lit = c
+        if lit is not None and depth == 0:
+            run.append(lit)
+            continue
+        best = max(best, "".join(run), key=len)
+        run = []
+    return max(best, "".join(run), key=len)
+
+
+def _candidates(project_id: str, literal: str, case: bool):
+    stmt = select(File.path, File.content).where(File.project_id == project_id)
+    if len(literal) < _MIN_LITERAL:
+        return stmt
+    # On Postgres this LIKE/ILIKE is served by ix_files_content_trgm
+    # (pg_trgm), skipping files that can't match; lines, and regexes in
+    # full, are matched in Python.
+    cond = File.content.contains if case else File.content.icontains
+    return stmt.where(cond(literal, autoescape=True))
+
+
+def _scan(rows, pattern, path, after, items, limit, deadline, fresh):
+    """Append the matches in `rows` to `items`, in a worker thread.
+
+    Returns the cursor the page ends at (`limit` matches or `deadline`
+    reached), or None to go on with the next rows. `fresh`: nothing was
+    scanned yet for this page.
+    """
+    for fpath, content in rows:
+        skip = after if fpath == path else 0
+        kept = len(items)
+        try:
+            for match in line_matches(
+                fpath, content, pattern, skip, max(deadline - time.monotonic(), 0)
+            ):
+                if len(items) == limit:
+                    last = items[-1]
+                    return encode_cursor(last["path"], last["line"])
+                items.append(match)
+        except TimeoutError:
+            if fresh:
+                # a whole page budget on one file: don't resume into it forever
+                raise SearchError(f"pattern too slow to match in {fpath}")
+            del items[kept:]
+            return encode_cursor(fpath, skip)
+        if time.monotonic() > deadline:
+            return encode_cursor(fpath, 1 << 31)
+        fresh = False
+    return None
+
+
+async def search_files(
+    db: AsyncSession,
+    project_id: str,
+    q: str,
+    regex: bool = False,
+    case: bool = False,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """Line-level matches of `q` in a project, ordered by (path, line).
+
+    Stops at `limit` matches or once `SEARCH_BUDGET_MS` is spent; either way
+    `next_cursor` resumes where this page ended.
+    """
+    pattern = compile_query(q, regex, case)
+    path, after = decode_cursor(cursor) if cursor else ("", 0)
+    deadline = time.monotonic() + settings.SEARCH_BUDGET_MS / 1000
+    stmt = _candidates(project_id, required_literal(q) if regex else q, case)
+    items: list[dict] = []
+    first = True
+    while True:
+        keyset = File.path >= path if first else File.path > path
+        page = stmt.where(keyset).order_by(File.path).limit(_BATCH)
+        rows = (await db.execute(page)).all()
+        # off the event loop; the regex timeout stops runaway backtracking
+        end = await asyncio.to_thread(
+            _scan, rows, pattern, path, after, items, limit, deadline, first
+        )
+        if end is not None:
+            return items, end
+        if len(rows) < _BATCH:
+            return items, None
+        path, first = rows[-1][0], False
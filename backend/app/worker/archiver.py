@@ -0,0 +1,162 @@
+import argparse, asyncio, gzip, logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, delete, select, text, update
+from app.core.config import get_settings
+from app.core.logging import setup_logging
+from app.db.models import Run
+from app.db.partitions import (
+    ensure_run_partitions,
+    expired_run_partitions,
+    runs_is_partitioned,
+)
+from app.db.session import dispose_engine, get_engine
+from app.services.blobs import get_blob_store
+
+settings = get_settings()
+log = logging.getLogger("worker.archiver")
+
+
+def _archive_blobs(rows) -> list[dict]:
+    """Write inline output of `rows` to the blob store (blocking)."""
+    store = get_blob_store()
+    updates = []
+    for r in rows:
+        key = r.output_key or f"runs/{r.id}"
+        sizes = {}
+        for stream in ("stdout", "stderr"):
+            data = (getattr(r, stream) or "").encode()
+            sizes[stream] = len(data)
+            # truncated runs have only the stream(s) that overflowed spilled
+            if not store.exists(f"{key}/{stream}.gz"):
+                store.put(f"{key}/{stream}.gz", gzip.compress(data, 6))
+        row = {"b_id": r.id, "b_created": r.created_at, "output_key": key}
+        for stream in ("stdout", "stderr"):
+            known = getattr(r, f"{stream}_bytes")
+            row[f"{stream}_bytes"] = sizes[stream] if known is None else known
+        updates.append(row)
+    return updates
+
+
+async def archive_outputs(now: datetime) -> int:
+    """Move stdout/stderr of finished runs older than RUN_ARCHIVE_AFTER_DAYS
+    out of the table into compressed blobs, in batches."""
+    cutoff = now - timedelta(days=settings.RUN_ARCHIVE_AFTER_DAYS)
+    t = Run.__table__
+    stmt = (
+        update(t)
+        .where(t.c.id == bindparam("b_id"), t.c.created_at == bindparam("b_created"))
+        .values(stdout=None, stderr=None, output_archived=True)
+    )
+    total = 0
+    while True:
+        async with get_engine().begin() as conn:
+            rows = (
+                await conn.execute(
+                    select(
+                        t.c.id,
+                        t.c.created_at,
+                        t.c.stdout,
+                        t.c.stderr,
+                        t.c.stdout_bytes,
+                        t.c.stderr_bytes,
+                        t.c.output_key,
+                    )
+                    .where(
+                        t.c.created_at < cutoff,
+                        t.c.finished_at.is_not(None),
+                        t.c.output_archived.is_(False),
+                    )
+                    .limit(settings.RUN_ARCHIVE_BATCH)
+                )
+            ).all()
+            if not rows:
+                return total
+            updates = await asyncio.to_thread(_archive_blobs, rows)
+            await conn.execute(stmt, updates)
+        total += len(rows)
+        log.info("archived output of %d runs", len(rows))
+
+
+async def _detach(name: str, pending: bool):
+    """Detach a partition without blocking `runs`: CONCURRENTLY can't run
+    in a transaction, and a detach that was interrupted is finalized."""
+    how = "FINALIZE" if pending else "CONCURRENTLY"
+    async with get_engine().connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"ALTER TABLE runs DETACH PARTITION {name} {how}"))
+
+
+async def _delete_blobs(keys: list[str]):
+    store = get_blob_store()
+    for key in keys:
+        await asyncio.to_thread(store.delete_prefix, key)
+
+
+async def drop_expired(now: datetime) -> int:
+    """Apply RUN_RETENTION_DAYS: drop whole monthly partitions when the table
+    is partitioned, otherwise fall back to a plain DELETE.
+
+    Blobs are deleted only once their rows are gone, so a failed pass can
+    leave unreferenced blobs but never rows pointing at missing ones.
+    """
+    cutoff = now - timedelta(days=settings.RUN_RETENTION_DAYS)
+    t = Run.__table__
+    async with get_engine().connect() as conn:
+        partitioned = await runs_is_partitioned(conn)
+        expired = await expired_run_partitions(conn, cutoff) if partitioned else []
+    if partitioned:
+        for name, pending in expired:
+            if pending is not None:  # still attached
+                await _detach(name, pending)
+            async with get_engine().begin() as conn:
+                keys = await conn.execute(
+                    text(f"SELECT output_key FROM {name} WHERE output_key IS NOT NULL")
+                )
+                keys = keys.scalars().all()
+                await conn.execute(text(f"DROP TABLE {name}"))
+            await _delete_blobs(keys)
+            log.info("dropped expired partition %s", name)
+        return len(expired)
+    async with get_engine().begin() as conn:
+        keys = await conn.execute(
+            select(t.c.output_key).where(
+                t.c.created_at < cutoff, t.c.output_key.is_not(None)
+            )
+        )
+        keys = keys.scalars().all()
+        res = await conn.execute(delete(t).where(t.c.created_at < cutoff))
+    await _delete_blobs(keys)
+    return res.rowcount or 0
+
+
+async def run_once():
+    now = datetime.now(timezone.utc)
+    async with get_engine().begin() as conn:
+        await ensure_run_partitions(
+            conn,
+            now,
+            months_back=0,
+            months_ahead=settings.RUN_PARTITION_MONTHS_AHEAD,
+        )
+    archived = await archive_outputs(now)
+    dropped = await drop_expired(now)
+    log.info("archiver pass done: archived=%d expired=%d", archived, dropped)
+
+
+async def main(once: bool = False):
+    while True:
+        try:
+            await run_once()
+        except Exception:
+            log.exception("archiver pass failed")
+        if once:
+            await dispose_engine()
+            return
+        await asyncio.sleep(settings.RUN_ARCHIVE_INTERVAL_S)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Run output archival and retention")
+    ap.add_argument("--once", action="store_true", help="single pass, then exit")
+    setup_logging()
+    asyncio.run(main(ap.parse_args().once))
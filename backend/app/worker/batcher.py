@@ -0,0 +1,209 @@
+import asyncio, json, logging, os
+from datetime import datetime
+from typing import Awaitable, Callable
+from sqlalchemy import bindparam, update
+from app.db.models import Run
+
+log = logging.getLogger("worker.batcher")
+
+# Columns a completion may set; every queued row carries all of them so the
+# batch can go out as a single executemany.
+COLUMNS = (
+    "status",
+    "stdout",
+    "stderr",
+    "wall_ms",
+    "stdout_bytes",
+    "stderr_bytes",
+    "output_truncated",
+    "output_key",
+    "timeline",
+    "finished_at",
+)
+
+_runs = Run.__table__
+# created_at (the partition key) lets Postgres touch only the run's partition
+UPDATE_STMT = update(_runs).where(
+    _runs.c.id == bindparam("b_id"), _runs.c.created_at == bindparam("b_created")
+)
+# rows without it (jobs queued or spilled by an earlier release) scan them all
+UPDATE_BY_ID_STMT = update(_runs).where(_runs.c.id == bindparam("b_id"))
+
+OnPersisted = Callable[[], Awaitable[None]]
+
+
+def completion_row(run_id: str, created_at: str | None = None, **values) -> dict:
+    """UPDATE parameters of a finished run; `created_at` is the run's
+    (ISO 8601, from the job payload)."""
+    row = {c: values.get(c) for c in COLUMNS}
+    row["b_id"] = run_id
+    row["b_created"] = datetime.fromisoformat(created_at) if created_at else None
+    if row["finished_at"] is None:
+        row["finished_at"] = datetime.utcnow()
+    if row["output_truncated"] is None:
+        row["output_truncated"] = False
+    return row
+
+
+class CompletionBatcher:
+    """Write-behind buffer for run completion updates.
+
+    Rows are flushed as one multi-row UPDATE in one transaction every
+    `flush_ms` or as soon as `max_rows` are queued, each flush on its own
+    short-lived session. `on_persisted` callbacks (the stream XACK and the
+    final run event) only run once a row is durable. If the database is
+    unavailable, rows are appended to `fallback_path` instead, acknowledged,
+    and replayed later; the file is also replayed on start so nothing is
+    lost across restarts. Lines that no longer parse (a spill cut short by
+    a crash) are moved to `<fallback_path>.bad` rather than retried.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        flush_ms: int = 50,
+        max_rows: int = 100,
+        fallback_path: str | None = None,
+        retry_s: float = 5.0,
+    ):
+        self.session_factory = session_factory
+        self.flush_s = flush_ms / 1000
+        self.max_rows = max_rows
+        self.fallback_path = fallback_path
+        self.retry_s = retry_s
+        self._pending: list[tuple[dict, OnPersisted | None]] = []
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self._last_replay = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        await self._replay_fallback()
+        self._task = asyncio.create_task(self._loop())
+
+    async def submit(self, row: dict, on_persisted: OnPersisted | None = None):
+        self._pending.append((row, on_persisted))
+        if len(self._pending) >= self.max_rows:
+            self._wake.set()
+
+    async def close(self):
+        """Stop the flush loop and persist (or spill) everything queued."""
+        self._closing = True
+        self._wake.set()
+        if self._task:
+            await self._task
+        await self.flush()
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+            if loop.time() - self._last_replay >= self.retry_s:
+                await self._replay_fallback()
+
+    async def _persist(self, rows: list[dict]):
+        keyed = [r for r in rows if r.get("b_created")]
+        unkeyed = [r for r in rows if not r.get("b_created")]
+        async with self.session_factory() as db:
+            if keyed:
+                await db.execute(UPDATE_STMT, keyed)
+            if unkeyed:
+                await db.execute(UPDATE_BY_ID_STMT, unkeyed)
+            await db.commit()
+
+    async def flush(self):
+        while self._pending:
+            batch = self._pending[: self.max_rows]
+            del self._pending[: len(batch)]
+            rows = [row for row, _ in batch]
+            try:
+                await self._persist(rows)
+            except Exception:
+                log.exception("completion flush of %d rows failed", len(rows))
+                if not self._spill(rows):
+                    # nowhere durable to put them: keep for the next attempt
+                    self._pending[:0] = batch
+                    return
+            for _, cb in batch:
+                if cb is None:
+                    continue
+                try:
+                    await cb()
+                except Exception:
+                    log.exception("completion callback failed")
+
+    def _spill(self, rows: list[dict]) -> bool:
+        if not self.fallback_path:
+            return False
+        try:
+            with open(self.fallback_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=_encode) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            return True
+        except OSError:
+            log.exception("could not spill completions to %s", self.fallback_path)
+            return False
+
+    async def _replay_fallback(self):
+        self._last_replay = asyncio.get_running_loop().time()
+        path = self.fallback_path
+        if not path or not os.path.exists(path):
+            return
+        replaying = path + ".replay"
+        # A leftover .replay file means an earlier replay was interrupted.
+        if not os.path.exists(replaying):
+            os.replace(path, replaying)
+        rows, bad = [], []
+        with open(replaying, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(_decode(json.loads(line)))
+                except ValueError:
+                    # e.g. a line cut short by a crash while spilling
+                    bad.append(line.rstrip("\n") + "\n")
+        if bad:
+            self._quarantine(bad)
+        try:
+            for i in range(0, len(rows), self.max_rows):
+                await self._persist(rows[i : i + self.max_rows])
+        except Exception:
+            log.warning("fallback replay failed, will retry", exc_info=True)
+            return
+        os.remove(replaying)
+        log.info("replayed %d spilled completions", len(rows))
+
+    def _quarantine(self, lines: list[str]):
+        """Set undecodable spill lines aside in `<fallback_path>.bad`."""
+        bad_path = self.fallback_path + ".bad"
+        log.error("skipping %d undecodable completions, see %s", len(lines), bad_path)
+        try:
+            with open(bad_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        except OSError:
+            log.exception("could not write %s", bad_path)
+
+
+def _encode(v):
+    if isinstance(v, datetime):
+        return {"$dt": v.isoformat()}
+    raise TypeError(type(v))
+
+
+def _decode(row: dict) -> dict:
+    for k, v in row.items():
+        if isinstance(v, dict) and "$dt" in v:
+            row[k] = datetime.fromisoformat(v["$dt"])
+    return row
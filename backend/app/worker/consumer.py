@@ -1,105 +1,358 @@
-import asyncio, json, tarfile, io, subprocess, sys
+import asyncio, logging, tarfile, io, os, signal, socket, sys, tempfile, time
 from app.core.config import get_settings
-from app.queues.redis import get_redis, RUN_STREAM, EVENT_PREFIX, SNAP_PREFIX
-from app.db.session import get_session
-from app.db.models import Run
+from app.core import metrics
+from app.core.metrics import timed
+from app.core.fastjson import dumps, loads
+from app.core.tracing import Timeline, export_timeline, now_ms
+from app.queues.redis import get_redis, close_redis, shard_streams
+from app.db.session import dispose_engine, get_sessionmaker
 from app.db.enums import RunStatus
-from app.services.run import mark_run_done
-from sqlalchemy.ext.asyncio import AsyncSession
+from app.services import memo
+from app.services.output import store_spill
+from app.services.run import publish_event
+from app.worker.batcher import CompletionBatcher, completion_row
+from app.worker.routing import ShardRouter, stream_id_ms
+from app.worker.sessions import KernelPool, create_pool
+from app.worker.workspaces import WorkspaceCache, create_workspaces
 
 settings = get_settings()
 GROUP = settings.RUN_GROUP
+log = logging.getLogger("worker")
+# a timed-out runner gets this long to report its output after SIGTERM
+_STOP_GRACE_S = 2.0
 
 
-async def ensure_group(r):
+async def _stop_runner(proc) -> bytes:
+    """Stop a runner past its time limit: it answers SIGTERM with the head
+    and tail captured so far; then its process group (node included) is
+    killed."""
+    out = b""
     try:
-        groups = await r.xinfo_groups(RUN_STREAM)
-        if not any(g[b"name"].decode() == GROUP for g in groups):
-            await r.xgroup_create(RUN_STREAM, GROUP, id="$", mkstream=True)
-    except Exception:
+        os.killpg(proc.pid, signal.SIGTERM)
+        out, _ = await asyncio.wait_for(proc.communicate(), _STOP_GRACE_S)
+    except (ProcessLookupError, asyncio.TimeoutError):
+        pass
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+    return out
+
+
+async def run_fresh(
+    payload: dict,
+    files: dict,
+    spill_dir: str,
+    tl: Timeline,
+    workdir: str | None = None,
+) -> dict:
+    # Execute using runner/worker.py; it spills full output under spill_dir.
+    # Async subprocess so the completion batcher keeps flushing meanwhile.
+    # With `workdir` (a javascript workspace) the files are already on disk.
+    with timed("process_spawn", tl):
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "app/runner_worker.py",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True,  # its own process group, see _stop_runner
+        )
+    job = dumps(
+        {
+            "files": {} if workdir else files,
+            "workdir": workdir,
+            "language": payload["language"],
+            "entrypoint": payload["entrypoint"],
+            "output": {
+                "head_bytes": settings.RUN_OUTPUT_HEAD_BYTES,
+                "tail_bytes": settings.RUN_OUTPUT_TAIL_BYTES,
+                "spill_max_bytes": settings.RUN_OUTPUT_SPILL_MAX_BYTES,
+                "spill_dir": spill_dir,
+            },
+        }
+    )
+    limit = payload.get("time_limit", settings.RUN_TIME_LIMIT_S)
+    with timed("execution", tl):
         try:
-            await r.xgroup_create(RUN_STREAM, GROUP, id="$", mkstream=True)
-        except Exception:
-            pass
+            out, _ = await asyncio.wait_for(proc.communicate(job), limit)
+        except asyncio.TimeoutError:
+            out = await _stop_runner(proc) or b"execution timed out\n"
+    try:
+        return loads(out)
+    except Exception:
+        # runner died before reporting; keep only the tail of what it wrote
+        return {
+            "status": "failed",
+            "stdout": "",
+            "stderr": out[-settings.RUN_OUTPUT_TAIL_BYTES :].decode(errors="replace"),
+            "wall_ms": 0,
+        }
 
 
-async def run_job(db: AsyncSession, r, msg_id: str, data: dict):
-    payload = json.loads(data[b"json"].decode())
+async def run_job(
+    r,
+    batcher: CompletionBatcher,
+    stream: str,
+    msg_id: str,
+    data: dict,
+    sessions: KernelPool | None = None,
+    workspaces: WorkspaceCache | None = None,
+):
+    picked_up = now_ms()
+    enqueued = stream_id_ms(msg_id)
+    metrics.RUN_PHASE.labels("queue_wait").observe(
+        max(0.0, picked_up - enqueued) / 1000
+    )
+    payload = loads(data[b"json"])
     run_id = payload["run_id"]
-    channel = EVENT_PREFIX + run_id
+    tl = Timeline.from_dict(payload.get("trace"))
+    tl.add("queue_wait", min(enqueued, picked_up), picked_up)
     # Send running state
-    await r.publish(
-        channel, json.dumps({"type": "update", "status": "running"}).encode()
-    )
+    with timed("publish", tl):
+        await publish_event(r, run_id, {"type": "update", "status": "running"})
     snap_key = payload["snap_key"]
-    snap = await r.get(snap_key)
+    with timed("snapshot_fetch", tl):
+        snap = await r.get(snap_key)
     files = {}
     if snap:
-        bio = io.BytesIO(snap)
-        with tarfile.open(fileobj=bio, mode="r:gz") as tf:
-            for member in tf.getmembers():
-                f = tf.extractfile(member)
-                if f:
-                    files[member.name] = f.read().decode()
-    # Execute using runner/worker.py
-    proc = subprocess.Popen(
-        [sys.executable, "app/runner_worker.py"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        text=True,
+        with timed("snapshot_decompress", tl):
+            bio = io.BytesIO(snap)
+            with tarfile.open(fileobj=bio, mode="r:gz") as tf:
+                for member in tf.getmembers():
+                    f = tf.extractfile(member)
+                    if f:
+                        files[member.name] = f.read().decode()
+    with tempfile.TemporaryDirectory(prefix="run-") as spill_dir:
+        res = None
+        if sessions is not None and payload.get("session"):
+            if payload["language"] == "python":
+                with timed("execution", tl):
+                    res = await sessions.execute(
+                        payload["project_id"],
+                        files,
+                        payload["entrypoint"],
+                        spill_dir,
+                        tl,
+                        reset=bool(payload.get("reset_session")),
+                    )
+        if res is None and workspaces is not None:
+            if payload["language"] == "javascript":
+                pid = payload["project_id"]
+                async with workspaces.checkout(pid, files, tl) as workdir:
+                    if workdir is not None:
+                        res = await run_fresh(payload, files, spill_dir, tl, workdir)
+        if res is None:
+            res = await run_fresh(payload, files, spill_dir, tl)
+        # runner-side stages, as [name, epoch start ms, duration ms]
+        for name, start, dur in res.get("spans", []):
+            tl.add(name, start, start + dur)
+        output_key = None
+        if res.get("truncated"):
+            with timed("output_spill", tl):
+                output_key = await asyncio.to_thread(store_spill, run_id, spill_dir)
+
+    final = {
+        "type": "update",
+        "status": res["status"],
+        "stdout": res.get("stdout"),
+        "stderr": res.get("stderr"),
+        "wall_ms": res.get("wall_ms"),
+        "truncated": bool(res.get("truncated")),
+        "session": res.get("session"),  # warm | cold, session runs only
+        "cells_run": res.get("cells_run"),
+    }
+    # Stored and exported alike: the stages after this point (db_persist,
+    # the final publish) can't be in the row they'd have to be written to,
+    # so they are metrics only
+    timeline = tl.to_dict()
+    submitted = time.perf_counter()
+
+    async def persisted():
+        # persist = write-behind wait + batched UPDATE, until durable
+        metrics.RUN_PHASE.labels("db_persist").observe(time.perf_counter() - submitted)
+        await r.xack(stream, GROUP, msg_id)
+        # only now, so GET /runs/{id} already agrees with the final event
+        with timed("publish"):
+            await publish_event(r, run_id, final)
+
+    # Write-behind: the stream entry is acked and the final event published
+    # once the row is durable
+    await batcher.submit(
+        completion_row(
+            run_id,
+            payload.get("created_at"),
+            status=RunStatus(res["status"]).value,
+            stdout=res.get("stdout", ""),
+            stderr=res.get("stderr", ""),
+            wall_ms=res.get("wall_ms", 0),
+            stdout_bytes=res.get("stdout_bytes"),
+            stderr_bytes=res.get("stderr_bytes"),
+            output_truncated=bool(res.get("truncated")),
+            output_key=output_key,
+            timeline=timeline,
+        ),
+        persisted,
     )
-    proc.stdin.write(
-        json.dumps(
-            {
-                "files": files,
-                "language": payload["language"],
-                "entrypoint": payload["entrypoint"],
-            }
-        )
+    metrics.RUNS_TOTAL.labels(res["status"]).inc()
+    if payload.get("memo_key"):
+        try:
+            await memo.store(r, payload["memo_key"], payload["language"], res)
+        except Exception:
+            log.warning("caching result of %s failed", run_id, exc_info=True)
+    export_timeline(
+        Timeline.from_dict(timeline), {"run.id": run_id, "run.status": res["status"]}
     )
-    proc.stdin.close()
-    out = proc.stdout.read()
-    proc.wait()
+
+
+async def give_up(
+    r, batcher: CompletionBatcher, stream: str, msg_id: str, data: dict, tries: int
+):
+    """Fail a run delivered `tries` times without finishing (it kept raising
+    or took its workers down) instead of re-running it forever."""
     try:
-        res = json.loads(out)
+        payload = loads(data[b"json"])
+        run_id = payload["run_id"]
     except Exception:
-        res = {"status": "failed", "stdout": "", "stderr": out, "wall_ms": 0}
-    await mark_run_done(
-        db,
-        run_id,
-        RunStatus(res["status"]),
-        res.get("stdout", ""),
-        res.get("stderr", ""),
-        res.get("wall_ms", 0),
-    )
-    await r.publish(
-        channel,
-        json.dumps(
-            {
-                "type": "update",
-                "status": res["status"],
-                "stdout": res.get("stdout"),
-                "stderr": res.get("stderr"),
-                "wall_ms": res.get("wall_ms"),
-            }
-        ).encode(),
+        log.error("dropping undecodable job %s", msg_id)
+        await r.xack(stream, GROUP, msg_id)
+        return
+    log.error("run %s failed %d attempts, giving up", run_id, tries - 1)
+    stderr = f"run abandoned after {tries - 1} failed attempts\n"
+
+    async def persisted():
+        await r.xack(stream, GROUP, msg_id)
+        await publish_event(
+            r, run_id, {"type": "update", "status": "failed", "stderr": stderr}
+        )
+
+    await batcher.submit(
+        completion_row(
+            run_id,
+            payload.get("created_at"),
+            status=RunStatus.failed.value,
+            stdout="",
+            stderr=stderr,
+            wall_ms=0,
+        ),
+        persisted,
     )
-    await r.xack(RUN_STREAM, GROUP, msg_id)
+    metrics.RUNS_TOTAL.labels(RunStatus.failed.value).inc()
 
 
-async def main():
+async def sample_stream(r, stop: asyncio.Event):
+    """Refresh stream length/pending gauges (all shards) until `stop` is set."""
+    streams = shard_streams()
+    while not stop.is_set():
+        try:
+            async with r.pipeline(transaction=False) as p:
+                for s in streams:
+                    p.xlen(s)
+                    p.xpending(s, GROUP)
+                res = await p.execute()
+            metrics.RUN_STREAM_LENGTH.set(sum(res[0::2]))
+            metrics.RUN_STREAM_PENDING.set(sum(x["pending"] for x in res[1::2]))
+        except Exception:
+            log.debug("stream sampling failed", exc_info=True)
+        try:
+            await asyncio.wait_for(stop.wait(), settings.WORKER_METRICS_SAMPLE_S)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def consume(
+    r,
+    batcher: CompletionBatcher,
+    router: ShardRouter,
+    name: str,
+    stop: asyncio.Event,
+    sessions: KernelPool | None = None,
+    workspaces: WorkspaceCache | None = None,
+):
+    while True:
+        if stop.is_set():
+            # finish jobs already read for this process, then exit
+            if router.local.empty():
+                return
+            job = router.local.get_nowait()
+        else:
+            job = await router.read(name)
+            if job is None:
+                continue
+        stream, msg_id, data, deliveries = job
+        if deliveries > settings.RUN_MAX_ATTEMPTS:
+            await give_up(r, batcher, stream, msg_id, data, deliveries)
+            continue
+        metrics.RUNS_IN_FLIGHT.inc()
+        try:
+            await run_job(r, batcher, stream, msg_id, data, sessions, workspaces)
+        except Exception:
+            # left pending: reclaimed after RUN_CLAIM_IDLE_S, up to
+            # RUN_MAX_ATTEMPTS deliveries
+            log.exception("run job %s failed", msg_id)
+        finally:
+            metrics.RUNS_IN_FLIGHT.dec()
+
+
+async def serve(
+    stop: asyncio.Event, concurrency: int | None = None, name: str | None = None
+):
+    """Run `concurrency` consumers of this worker's shards until `stop` is set."""
+    batcher = CompletionBatcher(
+        get_sessionmaker(),
+        flush_ms=settings.RUN_DONE_FLUSH_MS,
+        max_rows=settings.RUN_DONE_BATCH_SIZE,
+        fallback_path=settings.RUN_DONE_FALLBACK_PATH,
+    )
+    sessions = create_pool()
+    workspaces = create_workspaces()
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
     async with get_redis() as r:
-        await ensure_group(r)
-        async for db in get_session():
-            while True:
-                resp = await r.xreadgroup(
-                    GROUP, "consumer-1", streams={RUN_STREAM: ">"}, count=1, block=5000
+        router = ShardRouter(r, name)
+        await router.ensure_groups()
+        await memo.publish_runtimes(r)
+        await router.refresh()
+        await batcher.start()
+        sampler = asyncio.create_task(sample_stream(r, stop))
+        rebalancer = asyncio.create_task(router.run(stop))
+        reaper = asyncio.create_task(sessions.reap(stop)) if sessions else None
+        try:
+            await asyncio.gather(
+                *(
+                    consume(
+                        r, batcher, router, f"{name}-{i}", stop, sessions, workspaces
+                    )
+                    for i in range(concurrency or settings.WORKER_CONCURRENCY)
                 )
-                if not resp:
-                    continue
-                for _stream, messages in resp:
-                    for msg_id, data in messages:
-                        await run_job(db, r, msg_id, data)
+            )
+        finally:
+            stop.set()
+            await sampler
+            await rebalancer
+            await router.leave()
+            if sessions:
+                await reaper
+                await sessions.close()
+            if workspaces:
+                workspaces.close()
+            # drain queued completions (or spill them) before exiting
+            await batcher.close()
+
+
+async def main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    if settings.WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+
+        start_http_server(settings.WORKER_METRICS_PORT)
+    try:
+        await serve(stop)
+    finally:
+        await close_redis()
+        await dispose_engine()
 
 
 if __name__ == "__main__":
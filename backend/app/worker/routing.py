@@ -0,0 +1,202 @@
+import asyncio, hashlib, logging, time
+from app.core import metrics
+from app.core.config import get_settings
+from app.queues.redis import RUN_GROUP, RUN_STREAM, WORKERS_KEY, shard_streams
+
+settings = get_settings()
+log = logging.getLogger("worker.routing")
+
+
+def stream_id_ms(msg_id) -> int:
+    # stream ids are "<ms since epoch>-<seq>"
+    if isinstance(msg_id, bytes):
+        msg_id = msg_id.decode()
+    return int(msg_id.split("-", 1)[0])
+
+
+def _weight(worker: str, shard: str) -> int:
+    digest = hashlib.blake2b(f"{worker}|{shard}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def shard_owner(shard: str, workers: list[str]) -> str | None:
+    """Rendezvous hashing: the worker with the highest weight owns `shard`.
+    A worker joining or leaving moves only the shards it wins or held."""
+    return max(workers, key=lambda w: _weight(w, shard), default=None)
+
+
+class ShardRouter:
+    """Decides which run streams one worker process reads.
+
+    Workers heartbeat into the `WORKERS_KEY` sorted set. On each refresh a
+    worker drops members silent for `WORKER_HEARTBEAT_TTL_S`, assigns shards
+    to the live ones by rendezvous hashing and reads the shards it wins, so
+    all runs of a project reach the same worker. With `RUN_SHARDS=0` there
+    is one stream and every worker reads it.
+
+    When its own shards are empty a worker claims jobs left pending on them
+    by a worker that went away, then takes jobs from shards whose oldest
+    undelivered job waited longer than `RUN_STEAL_AFTER_MS`. Jobs still on
+    the single stream of earlier releases are taken the same way, without
+    waiting, until it is drained.
+
+    Jobs come with their delivery count (1 unless claimed), which lets the
+    consumer give up on a job that failed `RUN_MAX_ATTEMPTS` times.
+    """
+
+    def __init__(self, r, name: str):
+        self.r = r
+        self.name = name
+        self.shards = shard_streams()
+        self.shared = settings.RUN_SHARDS <= 0
+        self.owned: list[str] = list(self.shards) if self.shared else []
+        self.lagging: list[str] = []
+        # pre-sharding stream, read until drained (see ensure_groups)
+        self.legacy: list[str] = []
+        # jobs read beyond the one a consumer asked for (one per stream)
+        self.local: asyncio.Queue = asyncio.Queue()
+        self._next_claim = 0.0
+
+    async def ensure_groups(self):
+        if not self.shared and await self.r.exists(RUN_STREAM):
+            self.legacy = [RUN_STREAM]
+        for stream in self.shards + self.legacy:
+            try:
+                # from the start: the API may add jobs before any worker ran
+                await self.r.xgroup_create(stream, RUN_GROUP, id="0", mkstream=True)
+            except Exception:
+                pass  # BUSYGROUP: already there
+
+    async def refresh(self):
+        if self.shared:
+            return
+        now = time.time()
+        async with self.r.pipeline(transaction=False) as p:
+            p.zadd(WORKERS_KEY, {self.name: now})
+            p.zremrangebyscore(WORKERS_KEY, 0, now - settings.WORKER_HEARTBEAT_TTL_S)
+            p.zrange(WORKERS_KEY, 0, -1)
+            *_, members = await p.execute()
+        workers = [m.decode() for m in members]
+        owned = [s for s in self.shards if shard_owner(s, workers) == self.name]
+        if owned != self.owned:
+            log.info(
+                "%s now reads %d/%d shards (%d workers)",
+                self.name,
+                len(owned),
+                len(self.shards),
+                len(workers),
+            )
+        self.owned = owned
+        metrics.RUN_SHARDS_OWNED.set(len(owned))
+        others = [s for s in self.shards if s not in owned]
+        lags = await self._lag_ms(others + self.legacy)
+        self.lagging = [
+            s
+            for s, lag in zip(others + self.legacy, lags)
+            if lag > settings.RUN_STEAL_AFTER_MS or (s in self.legacy and lag > 0)
+        ]
+
+    async def _lag_ms(self, streams: list[str]) -> list[float]:
+        """Age of the oldest job in each stream not yet handed to a consumer."""
+        if not streams:
+            return []
+        async with self.r.pipeline(transaction=False) as p:
+            for s in streams:
+                p.xinfo_groups(s)
+            infos = await p.execute(raise_on_error=False)
+        last = {}
+        for s, groups in zip(streams, infos):
+            if isinstance(groups, Exception):
+                continue
+            for g in groups:
+                if g["name"].decode() == RUN_GROUP:
+                    last[s] = g["last-delivered-id"]
+        async with self.r.pipeline(transaction=False) as p:
+            for s in last:
+                p.xrange(s, min=b"(" + last[s], count=1)
+            oldest = dict(zip(last, await p.execute()))
+        now = time.time() * 1000
+        return [
+            now - stream_id_ms(oldest[s][0][0]) if oldest.get(s) else 0.0
+            for s in streams
+        ]
+
+    async def run(self, stop: asyncio.Event):
+        """Heartbeat and rebalance every `WORKER_REFRESH_S` until `stop`."""
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), settings.WORKER_REFRESH_S)
+            except asyncio.TimeoutError:
+                pass
+            if stop.is_set():
+                break
+            try:
+                await self.refresh()
+            except Exception:
+                log.warning("shard refresh failed", exc_info=True)
+
+    async def leave(self):
+        """Deregister so the other workers take over our shards right away."""
+        if not self.shared:
+            await self.r.zrem(WORKERS_KEY, self.name)
+            metrics.RUN_SHARDS_OWNED.set(0)
+
+    async def _claim(self, consumer: str):
+        """A job idle in some consumer's pending list, with its delivery count."""
+        if time.monotonic() < self._next_claim:
+            return None
+        for stream in self.owned + self.legacy:
+            resp = await self.r.xautoclaim(
+                stream,
+                RUN_GROUP,
+                consumer,
+                min_idle_time=settings.RUN_CLAIM_IDLE_S * 1000,
+                count=1,
+            )
+            messages = [m for m in resp[1] if m[1]]  # skip trimmed entries
+            if not messages:
+                continue
+            msg_id, data = messages[0]
+            pending = await self.r.xpending_range(
+                stream, RUN_GROUP, min=msg_id, max=msg_id, count=1
+            )
+            deliveries = pending[0]["times_delivered"] if pending else 1
+            metrics.RUN_JOBS_TAKEN.labels("reclaimed").inc()
+            return stream, msg_id, data, deliveries
+        self._next_claim = time.monotonic() + settings.WORKER_REFRESH_S
+        return None
+
+    async def read(self, consumer: str, block_ms: int = 1000):
+        """Next job for `consumer` as `(stream, msg_id, data, deliveries)`,
+        or None."""
+        if self.local.empty():
+            resp = None
+            if self.owned:
+                resp = await self.r.xreadgroup(
+                    RUN_GROUP,
+                    consumer,
+                    streams={s: ">" for s in self.owned},
+                    count=1,
+                    block=block_ms,
+                )
+            if not resp:
+                claimed = await self._claim(consumer)
+                if claimed:
+                    return claimed
+            if not resp and self.lagging:
+                resp = await self.r.xreadgroup(
+                    RUN_GROUP,
+                    consumer,
+                    streams={s: ">" for s in self.lagging},
+                    count=1,
+                )
+                taken = sum(len(messages) for _, messages in resp or ())
+                metrics.RUN_JOBS_TAKEN.labels("stolen").inc(taken)
+            if not resp and not self.owned:
+                await asyncio.sleep(block_ms / 1000)
+            for stream, messages in resp or ():
+                if isinstance(stream, bytes):
+                    stream = stream.decode()
+                for msg_id, data in messages:
+                    self.local.put_nowait((stream, msg_id, data, 1))
+        return None if self.local.empty() else self.local.get_nowait()
@@ -0,0 +1,369 @@
+import asyncio, hashlib, importlib.util, logging, os, re, shutil, tempfile, time
+from collections import OrderedDict
+from app.core import metrics
+from app.core.config import get_settings
+from app.runner_worker import OutputBuffer
+
+settings = get_settings()
+log = logging.getLogger("worker.sessions")
+
+# "# %%" splits an entrypoint into cells (VS Code / Jupytext convention)
+_CELL = re.compile(r"^#\s*%%.*$", re.M)
+_ANSI = re.compile(r"\x1b\[[0-9;]*m")
+# Only these reach the kernel; the worker's own env holds credentials.
+_KERNEL_ENV = ("PATH", "HOME", "LANG", "LC_ALL", "TMPDIR")
+# How often a running cell checks that its kernel is still there
+_LIVENESS_S = 0.5
+
+
+class KernelDied(RuntimeError):
+    pass
+
+
+def split_cells(code: str) -> list[str]:
+    starts = [m.start() for m in _CELL.finditer(code)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    cells = [code[a:b] for a, b in zip(starts, starts[1:] + [len(code)])]
+    return [c for c in cells if c.strip()] or [code]
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _module_name(path: str) -> str | None:
+    if not path.endswith(".py"):
+        return None
+    name = path[:-3].replace("/", ".")
+    return name[: -len(".__init__")] if name.endswith(".__init__") else name
+
+
+def _init_code(memory_mb: int) -> str:
+    code = "import os, sys\nsys.path.insert(0, os.getcwd())\n"
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        code += (
+            "import resource\n"
+            f"resource.setrlimit(resource.RLIMIT_AS, ({limit}, {limit}))\n"
+        )
+    return code
+
+
+class KernelSession:
+    """A warm IPython kernel holding one project's interpreter state.
+
+    Files live in a private working directory and are rewritten only when
+    their content hash changes; changed modules are dropped from
+    `sys.modules` so the next import picks them up. The entrypoint runs
+    cell by cell, and a re-run executes from the first changed cell on,
+    reusing everything computed before it.
+    """
+
+    def __init__(self, project_id: str):
+        self.project_id = project_id
+        self.workdir = tempfile.mkdtemp(prefix=f"session-{project_id[:8]}-")
+        self.files: dict[str, str] = {}  # path -> digest as last written
+        self.cells: list[str] = []  # digests of entrypoint cells already run
+        self.entry: str | None = None
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.km = self.kc = None
+
+    async def start(self):
+        from jupyter_client.manager import AsyncKernelManager
+
+        self.km = AsyncKernelManager(kernel_name=settings.SESSION_KERNEL)
+        env = {k: os.environ[k] for k in _KERNEL_ENV if k in os.environ}
+        await self.km.start_kernel(cwd=self.workdir, env=env)
+        self.kc = self.km.client()
+        self.kc.start_channels()
+        await self.kc.wait_for_ready(timeout=settings.SESSION_START_TIMEOUT_S)
+        await self._run(_init_code(settings.SESSION_MEMORY_MB), None, None, 10)
+
+    async def alive(self) -> bool:
+        try:
+            return self.km is not None and await self.km.is_alive()
+        except Exception:
+            return False
+
+    async def close(self):
+        try:
+            if self.kc is not None:
+                self.kc.stop_channels()
+            if self.km is not None:
+                await self.km.shutdown_kernel(now=True)
+        except Exception:
+            log.warning("kernel shutdown of %s failed", self.project_id, exc_info=True)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _sync_files(self, files: dict[str, str]) -> list[str]:
+        """Write changed files, delete removed ones; return stale modules."""
+        stale = []
+        for path in set(self.files) - set(files):
+            fp = os.path.join(self.workdir, path)
+            if os.path.exists(fp):
+                os.remove(fp)
+            self.files.pop(path)
+            stale.append(_module_name(path))
+        for path, content in files.items():
+            digest = _digest(content)
+            if self.files.get(path) == digest:
+                continue
+            fp = os.path.join(self.workdir, path)
+            os.makedirs(os.path.dirname(fp), exist_ok=True)
+            with open(fp, "w", encoding="utf-8") as f:
+                f.write(content)
+            if path in self.files:
+                stale.append(_module_name(path))
+            self.files[path] = digest
+        return [m for m in stale if m]
+
+    async def _run(self, code: str, stdout, stderr, timeout: float) -> str:
+        def hook(msg):
+            kind, content = msg["msg_type"], msg["content"]
+            if stdout is None:
+                return
+            if kind == "stream":
+                buf = stderr if content["name"] == "stderr" else stdout
+                buf.write(content["text"])
+            elif kind in ("execute_result", "display_data"):
+                text = content.get("data", {}).get("text/plain")
+                if text:
+                    stdout.write(text + "\n")
+            elif kind == "error":
+                stderr.write(_ANSI.sub("", "\n".join(content["traceback"])) + "\n")
+
+        # stop_on_error=False: cells go one at a time and failures are
+        # handled here; otherwise the kernel aborts the request after an
+        # interrupted cell
+        task = asyncio.ensure_future(
+            self.kc.execute_interactive(
+                code,
+                store_history=False,
+                stop_on_error=False,
+                timeout=timeout,
+                output_hook=hook,
+            )
+        )
+        # a kernel that dies mid-cell never replies: don't wait for the timeout
+        try:
+            while not (await asyncio.wait({task}, timeout=_LIVENESS_S))[0]:
+                if not await self.alive():
+                    raise KernelDied(f"kernel of {self.project_id} died")
+        finally:
+            task.cancel()
+        return task.result()["content"]["status"]
+
+    async def execute(self, files: dict[str, str], entry: str, spill_dir: str, tl):
+        """Run `entry` incrementally; returns a runner-shaped result dict."""
+        start = time.time()
+        if entry not in files:
+            return {
+                "status": "failed",
+                "stdout": "",
+                "stderr": f"entrypoint {entry} not found",
+                "wall_ms": 0,
+                "cells_run": 0,
+            }
+        stdout, stderr = _buffer(spill_dir, "stdout"), _buffer(spill_dir, "stderr")
+        with tl.span("session.sync_files"):
+            # the entrypoint itself runs as cells, it's never imported
+            stale = [m for m in self._sync_files(files) if m != _module_name(entry)]
+        cells = split_cells(files[entry])
+        digests = [_digest(c) for c in cells]
+        if entry != self.entry or stale:
+            first = 0  # new entrypoint or changed imports: start over
+        else:
+            done = self.cells
+            first = next(
+                (i for i, d in enumerate(digests) if i >= len(done) or d != done[i]),
+                len(cells) - 1,  # nothing changed: re-run the last cell
+            )
+        self.entry, self.cells = entry, digests[:first]
+        failed = False
+        with tl.span("session.exec"):
+            try:
+                if stale:
+                    await self._run(
+                        "import sys\n"
+                        f"for _m in {stale!r}:\n    sys.modules.pop(_m, None)\n",
+                        None,
+                        None,
+                        10,
+                    )
+                for i in range(first, len(cells)):
+                    left = max(0.1, settings.RUN_TIME_LIMIT_S - (time.time() - start))
+                    if await self._run(cells[i], stdout, stderr, left) != "ok":
+                        failed = True
+                        break
+                    self.cells.append(digests[i])
+            except TimeoutError:
+                failed = True
+                stderr.write("execution timed out; session state kept\n")
+                try:
+                    await self.km.interrupt_kernel()
+                except Exception:
+                    # already gone; the pool restarts it
+                    log.warning(
+                        "interrupting %s failed", self.project_id, exc_info=True
+                    )
+            except Exception:
+                # KernelDied, closed channels: the pool restarts the kernel
+                failed = True
+                log.warning("session run of %s failed", self.project_id, exc_info=True)
+        stdout.close()
+        stderr.close()
+        return {
+            "status": "failed" if failed else "succeeded",
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+            "stdout_bytes": stdout.total,
+            "stderr_bytes": stderr.total,
+            "truncated": stdout.truncated or stderr.truncated,
+            "wall_ms": int((time.time() - start) * 1000),
+            "cells_run": len(cells) - first,
+        }
+
+
+class KernelPool:
+    """Warm sessions of one worker process, keyed by project.
+
+    At most `max_kernels` kernels run at once; when a new project needs one,
+    the least recently used idle session is shut down. Sessions idle longer
+    than `idle_s` are reaped. Runs of the same project are serialized.
+    """
+
+    def __init__(self, max_kernels: int, idle_s: float):
+        self.max_kernels = max_kernels
+        self.idle_s = idle_s
+        self.sessions: OrderedDict[str, KernelSession] = OrderedDict()
+        self._users: dict[str, int] = {}
+        self._guard = asyncio.Lock()
+
+    async def _evict(self, project_id: str, reason: str):
+        s = self.sessions.pop(project_id)
+        self._users.pop(project_id, None)
+        metrics.RUN_SESSIONS.set(len(self.sessions))
+        metrics.RUN_SESSION_EVICTIONS.labels(reason).inc()
+        log.info("closing session of %s (%s)", project_id, reason)
+        await s.close()
+
+    async def _checkout(self, project_id: str, reset: bool) -> KernelSession | None:
+        async with self._guard:
+            s = self.sessions.get(project_id)
+            if s is not None and not self._users.get(project_id):
+                if reset:
+                    await self._evict(project_id, "reset")
+                elif s.km is not None and not await s.alive():
+                    await self._evict(project_id, "died")
+            s = self.sessions.get(project_id)
+            if s is None:
+                while len(self.sessions) >= self.max_kernels:
+                    idle = next(
+                        (p for p in self.sessions if not self._users.get(p)), None
+                    )
+                    if idle is None:
+                        return None  # every kernel is busy: run fresh instead
+                    await self._evict(idle, "lru")
+                s = self.sessions[project_id] = KernelSession(project_id)
+                metrics.RUN_SESSIONS.set(len(self.sessions))
+            self.sessions.move_to_end(project_id)
+            self._users[project_id] = self._users.get(project_id, 0) + 1
+            return s
+
+    def _release(self, s: KernelSession):
+        s.last_used = time.monotonic()
+        if self._users.get(s.project_id):
+            self._users[s.project_id] -= 1
+
+    async def execute(
+        self,
+        project_id: str,
+        files: dict[str, str],
+        entry: str,
+        spill_dir: str,
+        tl,
+        reset: bool = False,
+    ) -> dict | None:
+        """Run in the project's warm kernel; None means use a fresh runner."""
+        s = await self._checkout(project_id, reset)
+        if s is None:
+            return None
+        died = False
+        try:
+            async with s.lock:
+                warm = s.km is not None
+                if not warm:
+                    try:
+                        with tl.span("session.start"):
+                            await s.start()
+                    except Exception:
+                        log.exception("could not start kernel for %s", project_id)
+                        died = True
+                        return None
+                try:
+                    res = await s.execute(files, entry, spill_dir, tl)
+                except Exception:
+                    log.exception("session run of %s failed", project_id)
+                    died = True
+                    return {
+                        "status": "failed",
+                        "stdout": "",
+                        "stderr": "session failed; it was reset\n",
+                        "wall_ms": 0,
+                        "session": "warm" if warm else "cold",
+                    }
+                if not await s.alive():
+                    died = True
+                    res["status"] = "failed"
+                    res["stderr"] += "session kernel died (memory limit?); reset\n"
+                res["session"] = "warm" if warm else "cold"
+                return res
+        finally:
+            self._release(s)
+            if died:
+                async with self._guard:
+                    if self.sessions.get(project_id) is s and not self._users.get(
+                        project_id
+                    ):
+                        await self._evict(project_id, "died")
+
+    async def reap(self, stop: asyncio.Event):
+        """Close sessions idle for longer than `idle_s` until `stop` is set."""
+        interval = min(30.0, self.idle_s)
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            cutoff = time.monotonic() - self.idle_s
+            async with self._guard:
+                for pid, s in list(self.sessions.items()):
+                    if not self._users.get(pid) and s.last_used < cutoff:
+                        await self._evict(pid, "idle")
+
+    async def close(self):
+        async with self._guard:
+            for pid in list(self.sessions):
+                await self._evict(pid, "shutdown")
+
+
+def create_pool() -> KernelPool | None:
+    """The worker's session pool, or None when sessions are off or the
+    kernel packages (jupyter_client + ipykernel) aren't installed."""
+    if settings.SESSION_MAX_KERNELS <= 0:
+        return None
+    if importlib.util.find_spec("jupyter_client") is None:
+        log.warning("jupyter_client not installed; session runs execute fresh")
+        return None
+    return KernelPool(settings.SESSION_MAX_KERNELS, settings.SESSION_IDLE_S)
+
+
+def _buffer(spill_dir: str | None, name: str) -> OutputBuffer:
+    return OutputBuffer(
+        head=settings.RUN_OUTPUT_HEAD_BYTES,
+        tail=settings.RUN_OUTPUT_TAIL_BYTES,
+        spill_path=os.path.join(spill_dir, name + ".gz") if spill_dir else None,
+        spill_max=settings.RUN_OUTPUT_SPILL_MAX_BYTES,
+    )
@@ -0,0 +1,176 @@
+import asyncio, hashlib, logging, os, shutil, tempfile
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from app.core import metrics
+from app.core.config import get_settings
+
+settings = get_settings()
+log = logging.getLogger("worker.workspaces")
+
+
+def _digest(content: str) -> bytes:
+    return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+
+def _inside(root: str, path: str) -> str | None:
+    fp = os.path.normpath(os.path.join(root, path))
+    return fp if fp.startswith(root + os.sep) else None
+
+
+class Workspace:
+    """One project's files on local disk, rewritten only where they changed.
+
+    Runs don't execute here: each gets a directory of hard links to these
+    files (`link`), so setting up a run costs a link per file instead of a
+    write. A run writing into a linked file in place would change the cached
+    copy too; `verify` catches that afterwards by mtime and size and such
+    files are rewritten by the next `sync`.
+    """
+
+    def __init__(self, root: str, project_id: str):
+        self.project_id = project_id
+        self.dir = tempfile.mkdtemp(prefix="ws-", dir=root)
+        # path -> (content digest, mtime_ns, size) as written
+        self.files: dict[str, tuple[bytes, int, int]] = {}
+        self.bytes = 0
+        self.lock = asyncio.Lock()
+
+    def sync(self, files: dict[str, str]) -> int:
+        """Make the workspace hold exactly `files`; returns files written."""
+        for path in set(self.files) - set(files):
+            self._drop(path)
+            os.remove(os.path.join(self.dir, path))
+        written = 0
+        for path, content in files.items():
+            digest = _digest(content)
+            if path in self.files and self.files[path][0] == digest:
+                continue
+            fp = _inside(self.dir, path)
+            if fp is None:
+                continue
+            self._drop(path)
+            os.makedirs(os.path.dirname(fp), exist_ok=True)
+            with open(fp, "w", encoding="utf-8") as f:
+                f.write(content)
+            st = os.stat(fp)
+            self.files[path] = (digest, st.st_mtime_ns, st.st_size)
+            self.bytes += st.st_size
+            written += 1
+        return written
+
+    def _drop(self, path: str):
+        if path in self.files:
+            self.bytes -= self.files.pop(path)[2]
+
+    def link(self, run_root: str) -> str:
+        """A fresh directory of hard links to the workspace files."""
+        run_dir = tempfile.mkdtemp(prefix="run-", dir=run_root)
+        for path in self.files:
+            src, dst = os.path.join(self.dir, path), os.path.join(run_dir, path)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copyfile(src, dst)  # no hard links on this filesystem
+        return run_dir
+
+    def verify(self) -> int:
+        """Forget files changed through a run's links; returns their count."""
+        changed = []
+        for path, (_, mtime_ns, size) in self.files.items():
+            try:
+                st = os.stat(os.path.join(self.dir, path))
+            except FileNotFoundError:
+                changed.append(path)
+                continue
+            if (st.st_mtime_ns, st.st_size) != (mtime_ns, size):
+                changed.append(path)
+        for path in changed:
+            self._drop(path)
+        return len(changed)
+
+    def remove(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class WorkspaceCache:
+    """LRU of per-project workspaces of one worker process.
+
+    Holds at most `max_workspaces` workspaces and `max_bytes` of files;
+    idle ones are evicted least recently used first. A workspace serves one
+    run at a time, and a run that finds it busy gets no workspace (the
+    runner then writes a temporary directory as before).
+    """
+
+    def __init__(self, root: str, max_workspaces: int, max_bytes: int):
+        os.makedirs(root, exist_ok=True)
+        self.root = tempfile.mkdtemp(prefix="cache-", dir=root)
+        self.runs_dir = os.path.join(self.root, "runs")
+        os.makedirs(self.runs_dir)
+        self.max_workspaces = max_workspaces
+        self.max_bytes = max_bytes
+        self.workspaces: OrderedDict[str, Workspace] = OrderedDict()
+
+    def _checkout(self, project_id: str) -> Workspace | None:
+        ws = self.workspaces.get(project_id)
+        if ws is None:
+            ws = self.workspaces[project_id] = Workspace(self.root, project_id)
+            metrics.RUN_WORKSPACES.labels("cold").inc()
+        elif ws.lock.locked():
+            metrics.RUN_WORKSPACES.labels("busy").inc()
+            return None
+        else:
+            metrics.RUN_WORKSPACES.labels("warm").inc()
+        self.workspaces.move_to_end(project_id)
+        return ws
+
+    def _evict(self) -> list[Workspace]:
+        evicted, total = [], sum(ws.bytes for ws in self.workspaces.values())
+        for pid, ws in list(self.workspaces.items()):
+            if len(self.workspaces) <= self.max_workspaces and total <= self.max_bytes:
+                break
+            if ws.lock.locked():
+                continue
+            evicted.append(self.workspaces.pop(pid))
+            total -= ws.bytes
+        return evicted
+
+    @asynccontextmanager
+    async def checkout(self, project_id: str, files: dict[str, str], tl):
+        """Yield a run directory holding `files`, or None if the project's
+        workspace is busy with another run."""
+        ws = self._checkout(project_id)
+        if ws is None:
+            yield None
+            return
+        # no await between the busy check and taking the lock
+        async with ws.lock:
+            run_dir = None
+            try:
+                with tl.span("workspace.sync"):
+                    written = await asyncio.to_thread(ws.sync, files)
+                metrics.RUN_WORKSPACE_WRITES.inc(written)
+                with tl.span("workspace.link"):
+                    run_dir = await asyncio.to_thread(ws.link, self.runs_dir)
+                yield run_dir
+            finally:
+                if run_dir is not None:
+                    await asyncio.to_thread(shutil.rmtree, run_dir, True)
+                if await asyncio.to_thread(ws.verify):
+                    log.info("run modified workspace files of %s", project_id)
+        for old in self._evict():
+            await asyncio.to_thread(old.remove)
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.workspaces.clear()
+
+
+def create_workspaces() -> WorkspaceCache | None:
+    if settings.JS_WORKSPACE_MAX <= 0:
+        return None
+    return WorkspaceCache(
+        settings.JS_WORKSPACE_DIR,
+        settings.JS_WORKSPACE_MAX,
+        settings.JS_WORKSPACE_MAX_MB * 1024 * 1024,
+    )
@@ -0,0 +1,29 @@
+import statistics
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "n": len(values),
+        "mean": statistics.fmean(values) if values else float("nan"),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else float("nan"),
+    }
+
+
+def fmt_ms(stats: dict) -> str:
+    return (
+        f"n={stats['n']:<6} p50={stats['p50']:8.1f}ms p95={stats['p95']:8.1f}ms "
+        f"p99={stats['p99']:8.1f}ms max={stats['max']:8.1f}ms"
+    )
@@ -0,0 +1,199 @@
+"""Load benchmark for `/ai/suggest` and `/ai/suggest/stream`.
+
+Starts `bench.mock_llm` and the API in-process on loopback ports, points the
+OpenAI client at the mock and drives both endpoints with simulated typing
+users (bursts of keystrokes, a debounce pause, then a suggestion request).
+No network, database or real API key is needed:
+
+    cd backend && python -m bench.ai_load --users 20 --duration 30
+"""
+
+import argparse, asyncio, json, logging, os, random, socket, string, sys, time
+from types import SimpleNamespace
+from bench._stats import fmt_ms, summarize
+
+SEED = "import os\n\n\ndef load(path):\n    with open(path) as f:\n        return f.read()\n\n\n"
+CHARS = string.ascii_lowercase + " ()_=.:" + "\n"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _serve(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(
+            app, host="127.0.0.1", port=port, log_level="warning", access_log=False
+        )
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+def _payload(content: str) -> dict:
+    lines = content.split("\n")
+    return {
+        "path": "main.py",
+        "content": content,
+        "cursor_line": len(lines),
+        "cursor_col": len(lines[-1]) + 1,
+        "max_tokens": 64,
+    }
+
+
+async def typing_user(client, uid: int, deadline: float, args, res: dict):
+    rnd = random.Random(uid)
+    content = SEED
+    while time.monotonic() < deadline:
+        for _ in range(rnd.randint(1, args.burst)):
+            content += rnd.choice(CHARS)
+            await asyncio.sleep(rnd.expovariate(args.cps))
+        await asyncio.sleep(args.debounce_ms / 1000)
+        if time.monotonic() >= deadline:
+            break
+        body = _payload(content)
+        t0 = time.perf_counter()
+        try:
+            if rnd.random() < args.stream_ratio:
+                first = None
+                model = None
+                async with client.stream(
+                    "POST", "/api/ai/suggest/stream", json=body
+                ) as resp:
+                    resp.raise_for_status()
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        evt = json.loads(line[5:])
+                        if "delta" in evt and first is None:
+                            first = time.perf_counter()
+                        if evt.get("done"):
+                            model = evt.get("model")
+                end = time.perf_counter()
+                if model == "fallback":
+                    res["fallback"] += 1
+                    continue
+                res["stream"].append((end - t0) * 1000)
+                if first is not None:
+                    res["ttfd"].append((first - t0) * 1000)
+            else:
+                resp = await client.post("/api/ai/suggest", json=body)
+                resp.raise_for_status()
+                end = time.perf_counter()
+                if resp.json().get("model") == "fallback":
+                    res["fallback"] += 1
+                    continue
+                res["suggest"].append((end - t0) * 1000)
+        except Exception as e:
+            res["errors"] += 1
+            if args.verbose:
+                print(f"user {uid}: {e!r}", file=sys.stderr)
+
+
+async def run(args) -> dict:
+    from bench.mock_llm import create_app as create_mock
+
+    mock = create_mock(
+        latency_ms=args.latency_ms,
+        ttft_ms=args.ttft_ms,
+        tokens_per_s=args.tokens_per_s,
+        completion_tokens=args.completion_tokens,
+    )
+    mock_port, api_port = _free_port(), _free_port()
+    # Settings are read once on import, so configure before importing the app.
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{mock_port}/v1"
+    import httpx
+    from app.api.deps import get_current_user, get_db
+    from app.main import app
+
+    logging.getLogger().setLevel(logging.WARNING)  # drop per-request access logs
+
+    async def no_db():
+        yield None
+
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="bench")
+    app.dependency_overrides[get_db] = no_db
+
+    servers = [await _serve(mock, mock_port), await _serve(app, api_port)]
+    res = {"suggest": [], "stream": [], "ttfd": [], "errors": 0, "fallback": 0}
+    limits = httpx.Limits(
+        max_connections=args.users, max_keepalive_connections=args.users
+    )
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{api_port}", limits=limits, timeout=30
+        ) as client:
+            t0 = time.monotonic()
+            deadline = t0 + args.duration
+            await asyncio.gather(
+                *(
+                    typing_user(client, i, deadline, args, res)
+                    for i in range(args.users)
+                )
+            )
+            elapsed = time.monotonic() - t0
+    finally:
+        for server, task in servers:
+            server.should_exit = True
+            await task
+    done = len(res["suggest"]) + len(res["stream"])
+    return {
+        "users": args.users,
+        "duration_s": round(elapsed, 2),
+        "requests": done,
+        "rps": round(done / elapsed, 2),
+        "errors": res["errors"],
+        "fallback": res["fallback"],
+        "suggest_ms": summarize(res["suggest"]),
+        "stream_ms": summarize(res["stream"]),
+        "ttfd_ms": summarize(res["ttfd"]),
+        "upstream": mock.state.stats.as_dict(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="AI endpoint load benchmark")
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--duration", type=float, default=15, help="seconds")
+    ap.add_argument("--cps", type=float, default=6, help="keystrokes per second")
+    ap.add_argument("--burst", type=int, default=8, help="max keystrokes per burst")
+    ap.add_argument("--debounce-ms", type=float, default=250)
+    ap.add_argument("--stream-ratio", type=float, default=0.5)
+    ap.add_argument("--latency-ms", type=float, default=300)
+    ap.add_argument("--ttft-ms", type=float, default=150)
+    ap.add_argument("--tokens-per-s", type=float, default=50)
+    ap.add_argument("--completion-tokens", type=int, default=24)
+    ap.add_argument("--json", action="store_true", help="print raw JSON report")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        f"users={report['users']} duration={report['duration_s']}s "
+        f"requests={report['requests']} rps={report['rps']} "
+        f"errors={report['errors']} fallback={report['fallback']}"
+    )
+    print("suggest          ", fmt_ms(report["suggest_ms"]))
+    print("suggest/stream   ", fmt_ms(report["stream_ms"]))
+    print("time-to-1st-delta", fmt_ms(report["ttfd_ms"]))
+    up = report["upstream"]
+    print(
+        f"upstream requests={up['requests']} max_concurrency={up['max_in_flight']} "
+        f"mean_concurrency={up['mean_in_flight']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""JavaScript run setup with and without cached workspaces.
+
+Runs the same project through `run_fresh` (the runner writes every file into
+a temporary directory) and through `WorkspaceCache` (files rewritten only
+when changed, hard-linked into each run), editing `--changed` files between
+runs. Reports end-to-end run time and the setup phases per mode.
+
+    cd backend && python -m bench.js_workspace --files 1000 --file-bytes 8192
+
+Needs `node` on PATH.
+"""
+
+import argparse, asyncio, json, tempfile, time
+from bench._stats import fmt_ms, summarize
+
+
+def _files(n: int, file_bytes: int) -> dict[str, str]:
+    body = "// " + "x" * max(0, file_bytes - 4) + "\n"
+    files = {f"lib/m{i:04d}.js": f"module.exports = {i};\n{body}" for i in range(n)}
+    files["main.js"] = "console.log(require('./lib/m0000') + 1);\n"
+    return files
+
+
+async def _measure(args, files, cache) -> dict:
+    from app.core.tracing import Timeline
+    from app.worker.consumer import run_fresh
+
+    payload = {"language": "javascript", "entrypoint": "main.js", "project_id": "b"}
+    totals, phases = [], {}
+    for i in range(args.runs + 1):
+        for k in range(args.changed):
+            files[f"lib/m{k + 1:04d}.js"] = f"module.exports = {i};\n"
+        tl = Timeline()
+        t0 = time.perf_counter()
+        with tempfile.TemporaryDirectory() as spill_dir:
+            if cache is None:
+                res = await run_fresh(payload, files, spill_dir, tl)
+            else:
+                async with cache.checkout("b", files, tl) as workdir:
+                    res = await run_fresh(payload, files, spill_dir, tl, workdir)
+        if res["status"] != "succeeded":
+            raise SystemExit(f"run failed: {res['stderr'][-500:]}")
+        if i == 0:
+            continue  # the first run fills the cache
+        totals.append((time.perf_counter() - t0) * 1000)
+        for name, _start, dur in tl.spans + res.get("spans", []):
+            phases.setdefault(name, []).append(dur)
+    return {
+        "run": summarize(totals),
+        "phases": {k: round(sum(v) / len(v), 2) for k, v in phases.items()},
+    }
+
+
+async def run(args) -> dict:
+    from app.worker.workspaces import WorkspaceCache
+
+    files = _files(args.files, args.file_bytes)
+    report = {"fresh": await _measure(args, dict(files), None)}
+    cache = WorkspaceCache(tempfile.mkdtemp(prefix="bench-ws-"), 4, 1 << 34)
+    try:
+        report["workspace"] = await _measure(args, dict(files), cache)
+    finally:
+        cache.close()
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="JavaScript workspace benchmark")
+    ap.add_argument("--files", type=int, default=1000)
+    ap.add_argument("--file-bytes", type=int, default=8192)
+    ap.add_argument("--changed", type=int, default=1, help="files edited per run")
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--json", action="store_true", help="print raw JSON report")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for mode, r in report.items():
+        print(f"{mode:<10} {fmt_ms(r['run'])}")
+        print("  phases   " + " ".join(f"{k}={v}ms" for k, v in r["phases"].items()))
+
+
+if __name__ == "__main__":
+    main()
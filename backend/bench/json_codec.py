@@ -0,0 +1,140 @@
+"""Microbenchmark of the JSON codec on hot-path payloads.
+
+Compares the stdlib encoders the code used before (`json.dumps`, Starlette's
+`JSONResponse.render`) with `app.core.fastjson` / `FastJSONResponse` on:
+
+- a `list_files` response (many files with realistic content)
+- a runner result carrying full head+tail output buffers
+- the final run event relayed over pub/sub
+- a log record
+
+    cd backend && python -m bench.json_codec --files 500 --file-bytes 4096
+"""
+
+import argparse, json, random, string, time
+from bench._stats import summarize
+
+
+def _text(rnd: random.Random, n: int) -> str:
+    letters = string.ascii_lowercase
+    words = ["".join(rnd.choices(letters, k=rnd.randint(2, 9))) for _ in range(200)]
+    out, size = [], 0
+    while size < n:
+        indent = "    " * rnd.randint(0, 3)
+        line = indent + " ".join(rnd.choices(words, k=rnd.randint(3, 12)))
+        out.append(line)
+        size += len(line) + 1
+    return "\n".join(out)[:n]
+
+
+def payloads(files: int, file_bytes: int, output_bytes: int) -> dict:
+    rnd = random.Random(0)
+    list_files = [
+        {
+            "id": f"{rnd.getrandbits(128):032x}",
+            "path": f"src/pkg_{i // 50}/module_{i}.py",
+            "content": _text(rnd, file_bytes),
+        }
+        for i in range(files)
+    ]
+    out = _text(rnd, output_bytes)
+    run_result = {
+        "status": "succeeded",
+        "stdout": out,
+        "stderr": _text(rnd, 2048),
+        "stdout_bytes": 10 * output_bytes,
+        "stderr_bytes": 2048,
+        "truncated": True,
+        "wall_ms": 1234,
+        "spans": [["runner.exec", 1.7e12 + i, 12.5] for i in range(2)],
+    }
+    event = {
+        "type": "update",
+        "status": "succeeded",
+        "stdout": out,
+        "stderr": "",
+        "wall_ms": 1234,
+        "truncated": True,
+    }
+    log = {
+        "level": "INFO",
+        "msg": "/ai/suggest returning model=gpt-4o-mini chars=118",
+        "logger": "ai",
+        "time": "2025-01-01T12:00:00",
+    }
+    return {
+        "list_files": list_files,
+        "run_result": run_result,
+        "event": event,
+        "log": log,
+    }
+
+
+def _time(fn, arg, min_s: float) -> list[float]:
+    """Per-call microseconds, repeated until at least `min_s` seconds."""
+    samples, total = [], 0.0
+    while total < min_s or len(samples) < 5:
+        t0 = time.perf_counter()
+        fn(arg)
+        dt = time.perf_counter() - t0
+        samples.append(dt * 1e6)
+        total += dt
+    return samples
+
+
+def run(args) -> dict:
+    from fastapi.responses import JSONResponse
+    from app.api.responses import FastJSONResponse
+    from app.core import fastjson
+
+    std_response = JSONResponse.__new__(JSONResponse)
+    fast_response = FastJSONResponse.__new__(FastJSONResponse)
+    report = {"backend": fastjson.BACKEND, "payloads": {}}
+    for name, obj in payloads(args.files, args.file_bytes, args.output_bytes).items():
+        encoded = json.dumps(obj).encode()
+        cases = {
+            "encode": (lambda o: json.dumps(o).encode(), fastjson.dumps, obj),
+            "decode": (json.loads, fastjson.loads, encoded),
+        }
+        if name == "list_files":
+            cases["response"] = (std_response.render, fast_response.render, obj)
+        row = {"bytes": len(encoded)}
+        for case, (std, fast, arg) in cases.items():
+            s = summarize(_time(std, arg, args.min_s))["p50"]
+            f = summarize(_time(fast, arg, args.min_s))["p50"]
+            row[case] = {
+                "stdlib_us": round(s, 1),
+                "fast_us": round(f, 1),
+                "speedup": round(s / f, 2),
+            }
+        report["payloads"][name] = row
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="JSON codec microbenchmark")
+    ap.add_argument("--files", type=int, default=500, help="files in list_files")
+    ap.add_argument("--file-bytes", type=int, default=4096)
+    ap.add_argument("--output-bytes", type=int, default=128 * 1024, help="run output")
+    ap.add_argument("--min-s", type=float, default=0.5, help="seconds per measurement")
+    ap.add_argument("--json", action="store_true", help="print raw JSON report")
+    args = ap.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"fast backend: {report['backend']}  (p50 per call)")
+    for name, row in report["payloads"].items():
+        print(f"\n{name} ({row['bytes'] / 1024:.1f} KiB)")
+        for case in ("encode", "decode", "response"):
+            if case in row:
+                c = row[case]
+                print(
+                    f"  {case:<9} stdlib={c['stdlib_us']:>10.1f}us "
+                    f"fast={c['fast_us']:>10.1f}us  x{c['speedup']}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Local OpenAI-compatible stand-in for `/v1/chat/completions`.
+
+Timing is configurable so the AI endpoints can be load tested offline:
+`ttft_ms` is the delay before the first streamed token, `latency_ms` the
+total delay of a non-streaming reply, and `tokens_per_s` paces the rest of a
+stream. Run standalone with `python -m bench.mock_llm --port 8089`.
+"""
+
+import argparse, asyncio, json, random, time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TOKENS = ["    ", "return", " ", "value", "\n", "if", " x", ":", " pass", "\n"]
+
+
+class UpstreamStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        # (monotonic time, in_flight) at every change, for time-weighted mean
+        self.samples: list[tuple[float, int]] = []
+
+    def enter(self):
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.samples.append((time.monotonic(), self.in_flight))
+
+    def leave(self):
+        self.in_flight -= 1
+        self.samples.append((time.monotonic(), self.in_flight))
+
+    def mean_in_flight(self) -> float:
+        if len(self.samples) < 2:
+            return 0.0
+        area = 0.0
+        for (t0, n), (t1, _) in zip(self.samples, self.samples[1:]):
+            area += n * (t1 - t0)
+        span = self.samples[-1][0] - self.samples[0][0]
+        return area / span if span else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "mean_in_flight": round(self.mean_in_flight(), 2),
+        }
+
+
+def create_app(
+    latency_ms: float = 300,
+    ttft_ms: float = 150,
+    tokens_per_s: float = 50,
+    completion_tokens: int = 24,
+    jitter: float = 0.1,
+) -> FastAPI:
+    app = FastAPI(title="mock-llm")
+    stats = UpstreamStats()
+    app.state.stats = stats
+
+    def _jit(ms: float) -> float:
+        return max(0.0, ms * (1 + random.uniform(-jitter, jitter))) / 1000
+
+    def _n_tokens(body: dict) -> int:
+        return max(
+            1, min(completion_tokens, body.get("max_tokens") or completion_tokens)
+        )
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "mock")
+        n = _n_tokens(body)
+        created = int(time.time())
+        if not body.get("stream"):
+            stats.enter()
+            try:
+                await asyncio.sleep(_jit(latency_ms))
+            finally:
+                stats.leave()
+            text = "".join(TOKENS[i % len(TOKENS)] for i in range(n))
+            return JSONResponse(
+                {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": n,
+                        "total_tokens": n,
+                    },
+                }
+            )
+
+        def chunk(delta: dict, finish: str | None = None) -> str:
+            return (
+                "data: "
+                + json.dumps(
+                    {
+                        "id": "chatcmpl-mock",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [
+                            {"index": 0, "delta": delta, "finish_reason": finish}
+                        ],
+                    }
+                )
+                + "\n\n"
+            )
+
+        async def gen():
+            stats.enter()
+            try:
+                await asyncio.sleep(_jit(ttft_ms))
+                yield chunk({"role": "assistant", "content": ""})
+                for i in range(n):
+                    if i:
+                        await asyncio.sleep(_jit(1000 / tokens_per_s))
+                    yield chunk({"content": TOKENS[i % len(TOKENS)]})
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+            finally:
+                stats.leave()
+
+        return StreamingResponse(gen(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats.as_dict()
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=300)
+    ap.add_argument("--ttft-ms", type=float, default=150)
+    ap.add_argument("--tokens-per-s", type=float, default=50)
+    ap.add_argument("--completion-tokens", type=int, default=24)
+    a = ap.parse_args()
+    app = create_app(a.latency_ms, a.ttft_ms, a.tokens_per_s, a.completion_tokens)
+    uvicorn.run(app, host=a.host, port=a.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""End-to-end benchmark of the run pipeline.
+
+Drives the real path a run takes -- `POST /runs/start` (snapshot + enqueue),
+the Redis stream, the worker consumer (snapshot fetch, runner subprocess,
+write-behind completion) and the WebSocket event stream -- for projects of
+increasing size and a range of worker concurrencies.
+
+The API and worker run in-process. By default Redis is an in-memory
+fakeredis server and the database a temporary SQLite file, so nothing needs
+to be running; pass --redis-url / --database-url to measure against real
+services instead:
+
+    cd backend && python -m bench.pipeline --sizes 1,10,100 --concurrency 1,4
+
+Per cell it reports, from the client's side: `start` (POST /runs/start
+round trip), `running` (submit until the worker's "running" event, i.e.
+queue wait plus snapshot fetch) and `end2end` (submit until the terminal
+event). The runner's output is published with the terminal event, so
+time to first output equals `end2end`; `phases` splits the worker's share.
+
+Bench-only dependencies: fakeredis, aiosqlite, websockets, uvicorn, httpx.
+"""
+
+import argparse, asyncio, json, logging, os, sys, tempfile, time
+from bench._stats import fmt_ms, summarize
+from bench.ai_load import _free_port, _serve
+
+TERMINAL = {"succeeded", "failed", "killed"}
+
+
+def _project_files(n: int, file_bytes: int) -> dict[str, str]:
+    body = "# " + "x" * max(0, file_bytes - 3) + "\n"
+    files = {f"pkg/mod_{i:04d}.py": body for i in range(max(0, n - 1))}
+    files["main.py"] = "import sys\nprint('hello from', sys.argv[0])\n"
+    return files
+
+
+def _use_fake_redis():
+    """Route every `redis.asyncio.from_url` to one shared fakeredis server."""
+    import fakeredis
+    from redis import asyncio as aioredis
+
+    server = fakeredis.FakeServer()
+
+    class BlockingFakeRedis(fakeredis.aioredis.FakeRedis):
+        # fakeredis returns from XREADGROUP at once instead of honouring
+        # BLOCK; poll so consumers behave like they would against Redis.
+        async def xreadgroup(self, *args, block=None, **kwargs):
+            deadline = time.monotonic() + (block or 0) / 1000
+            while True:
+                resp = await super().xreadgroup(*args, **kwargs)
+                if resp or block is None or time.monotonic() >= deadline:
+                    return resp
+                await asyncio.sleep(0.002)
+
+    aioredis.from_url = lambda url, **kw: BlockingFakeRedis(server=server, **kw)
+
+
+async def _seed(sizes: list[int], file_bytes: int) -> tuple[str, dict[int, str]]:
+    from app.core.security import create_access_token
+    from app.db.models import File, Project, User
+    from app.db.session import get_sessionmaker
+
+    async with get_sessionmaker()() as db:
+        user = User(email=f"bench-{time.time_ns()}@local", password_hash="-")
+        db.add(user)
+        await db.flush()
+        projects = {}
+        for n in sizes:
+            p = Project(owner_id=user.id, name=f"bench-{n}")
+            db.add(p)
+            await db.flush()
+            db.add_all(
+                File(project_id=p.id, path=path, content=content)
+                for path, content in _project_files(n, file_bytes).items()
+            )
+            projects[n] = p.id
+        await db.commit()
+    return create_access_token(user.id), projects
+
+
+async def _one_run(client, ws_base: str, pid: str, res: dict):
+    import websockets
+
+    t0 = time.perf_counter()
+    resp = await client.post(
+        "/api/runs/start",
+        params={"pid": pid},
+        json={"entrypoint": "main.py", "language": "python"},
+    )
+    resp.raise_for_status()
+    run_id = resp.json()["run_id"]
+    res["start"].append((time.perf_counter() - t0) * 1000)
+    running = None
+    async with websockets.connect(f"{ws_base}/api/runs/{run_id}/stream") as ws:
+        async for raw in ws:
+            evt = json.loads(raw)
+            status = evt.get("status")
+            now = (time.perf_counter() - t0) * 1000
+            if status == "running" and running is None:
+                running = now
+            elif status in TERMINAL:
+                # the catch-up replay skips "running" if we subscribed late
+                res["running"].append(running if running is not None else now)
+                res["e2e"].append(now)
+                if status != "succeeded":
+                    res["failed"] += 1
+                return
+
+
+async def _cell(client, ws_base: str, pid: str, runs: int, clients: int) -> dict:
+    res = {"start": [], "running": [], "e2e": [], "failed": 0, "errors": 0}
+    queue = asyncio.Queue()
+    for _ in range(runs):
+        queue.put_nowait(None)
+
+    async def submitter():
+        while not queue.empty():
+            queue.get_nowait()
+            try:
+                await asyncio.wait_for(_one_run(client, ws_base, pid, res), 120)
+            except Exception as e:
+                res["errors"] += 1
+                print(f"run failed: {e!r}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(submitter() for _ in range(clients)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "runs": len(res["e2e"]),
+        "failed": res["failed"],
+        "errors": res["errors"],
+        "runs_per_s": round(len(res["e2e"]) / elapsed, 2),
+        "start_ms": summarize(res["start"]),
+        "running_ms": summarize(res["running"]),
+        "e2e_ms": summarize(res["e2e"]),
+    }
+
+
+def _phase_means() -> dict:
+    """Mean seconds per worker phase from the in-process RUN_PHASE histogram."""
+    from app.core.metrics import RUN_PHASE
+
+    sums, counts = {}, {}
+    for metric in RUN_PHASE.collect():
+        for s in metric.samples:
+            phase = s.labels.get("phase")
+            if s.name.endswith("_sum"):
+                sums[phase] = s.value
+            elif s.name.endswith("_count"):
+                counts[phase] = s.value
+    return {p: (sums[p], counts[p]) for p in sums}
+
+
+async def run(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="bench-pipeline-")
+    # Settings are read once on import, so configure before importing the app.
+    os.environ["DATABASE_URL"] = args.database_url or (
+        f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+    )
+    os.environ["WORKER_METRICS_PORT"] = "0"
+    os.environ["BLOB_DIR"] = os.path.join(tmp, "blobs")
+    os.environ["RUN_DONE_FALLBACK_PATH"] = os.path.join(tmp, "completions.jsonl")
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+    else:
+        _use_fake_redis()
+
+    import httpx
+    from app.main import app
+    from app.scripts.init_db import main as init_db
+    from app.worker.consumer import serve
+
+    logging.getLogger().setLevel(logging.WARNING)
+    await init_db()
+    token, projects = await _seed(args.sizes, args.file_bytes)
+
+    port = _free_port()
+    server, task = await _serve(app, port)
+    cells = []
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=60,
+        ) as client:
+            for conc in args.concurrency:
+                stop = asyncio.Event()
+                worker = asyncio.create_task(serve(stop, conc))
+                try:
+                    for n in args.sizes:
+                        before = _phase_means()
+                        cell = await _cell(
+                            client,
+                            f"ws://127.0.0.1:{port}",
+                            projects[n],
+                            args.runs,
+                            args.clients,
+                        )
+                        after = _phase_means()
+                        cell["phase_ms"] = {
+                            p: round(
+                                (s - before.get(p, (0, 0))[0])
+                                / max(1, c - before.get(p, (0, 0))[1])
+                                * 1000,
+                                2,
+                            )
+                            for p, (s, c) in after.items()
+                        }
+                        cells.append({"files": n, "concurrency": conc, **cell})
+                finally:
+                    stop.set()
+                    await worker
+    finally:
+        server.should_exit = True
+        await task
+    return {
+        "redis": args.redis_url or "fakeredis",
+        "database": os.environ["DATABASE_URL"].split("://", 1)[0],
+        "runs_per_cell": args.runs,
+        "clients": args.clients,
+        "cells": cells,
+    }
+
+
+def _ints(s: str) -> list[int]:
+    return [int(x) for x in s.split(",") if x]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="End-to-end run pipeline benchmark")
+    ap.add_argument(
+        "--sizes", type=_ints, default=[1, 10, 100, 1000], help="files per project"
+    )
+    ap.add_argument(
+        "--concurrency", type=_ints, default=[1, 2, 4], help="worker consumers"
+    )
+    ap.add_argument("--runs", type=int, default=20, help="runs per cell")
+    ap.add_argument("--clients", type=int, default=8, help="concurrent submitters")
+    ap.add_argument("--file-bytes", type=int, default=1024)
+    ap.add_argument("--redis-url", help="use a real Redis instead of fakeredis")
+    ap.add_argument("--database-url", help="use a real database instead of SQLite")
+    ap.add_argument("--json", action="store_true", help="print raw JSON report")
+    args = ap.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(
+        f"redis={report['redis']} db={report['database']} "
+        f"runs/cell={report['runs_per_cell']} clients={report['clients']}"
+    )
+    for c in report["cells"]:
+        print(
+            f"\nfiles={c['files']:<5} workers={c['concurrency']:<3} "
+            f"runs/s={c['runs_per_s']:<7} failed={c['failed']} errors={c['errors']}"
+        )
+        print("  start    ", fmt_ms(c["start_ms"]))
+        print("  running  ", fmt_ms(c["running_ms"]))
+        print("  end2end  ", fmt_ms(c["e2e_ms"]))
+        print(
+            "  phases   ",
+            " ".join(f"{p}={v}ms" for p, v in sorted(c["phase_ms"].items())),
+        )
+
+
+if __name__ == "__main__":
+    main()
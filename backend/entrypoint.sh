@@ -6,8 +6,6 @@ if [ -n "${DATABASE_URL}" ]; then
   python - <<'PY'
 import asyncio, os, time
 from urllib.parse import urlparse
-from app.db.session import engine
-from sqlalchemy import text
 
 u = urlparse(os.environ['DATABASE_URL'].replace('+asyncpg',''))
 host, port = u.hostname, u.port or 5432
@@ -22,11 +20,8 @@ for _ in range(60):
 else:
     raise SystemExit('Database not reachable')
 
-async def init():
-    from app.db.models import Base
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-asyncio.run(init())
+from app.scripts.init_db import main as init_db
+asyncio.run(init_db())
 print('DB ready.')
 PY
 fi
@@ -58,6 +58,23 @@ export const api = {
   startRun: (pid, payload, token) =>
     request(`/runs/start?pid=${pid}`, { method: "POST", body: payload, token }),
   getRun: (id, token) => request(`/runs/${id}`, { token }),
+  clearRunCache: (pid, token) =>
+    request(`/projects/${pid}/run-cache`, { method: "DELETE", token }),
+  listRuns: (pid, { cursor, limit } = {}, token) =>
+    request(
+      `/projects/${pid}/runs?` +
+        new URLSearchParams({
+          ...(cursor ? { cursor } : {}),
+          ...(limit ? { limit: String(limit) } : {}),
+        }),
+      { token }
+    ),
+  getRunOutput: (id, { stream = "stdout", offset = 0, limit } = {}, token) =>
+    request(
+      `/runs/${id}/output?stream=${stream}&offset=${offset}` +
+        (limit ? `&limit=${limit}` : ""),
+      { token }
+    ),
   // Files
   listProjectFiles: (pid, token) =>
     request(`/projects/${pid}/files`, { token }),
@@ -67,6 +84,45 @@ export const api = {
       body: { path, content },
       token,
     }),
+  // Archives: `file` is a zip / tar(.gz) Blob; export resolves to a Blob
+  importProject: async (pid, file, { strip = 0, replace = false } = {}, token) => {
+    const res = await fetch(
+      `${API_BASE}/projects/${pid}/import?strip=${strip}&replace=${replace}`,
+      {
+        method: "POST",
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+        body: file,
+      }
+    );
+    if (!res.ok) {
+      // a proxy 413 or an HTML error page has no JSON body
+      let msg = "Import failed";
+      try {
+        msg = (await res.json()).detail || msg;
+      } catch {}
+      throw new Error(msg);
+    }
+    return res.json();
+  },
+  exportProject: async (pid, format = "tar.gz", token) => {
+    const res = await fetch(`${API_BASE}/projects/${pid}/export?format=${format}`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+    });
+    if (!res.ok) throw new Error("Export failed");
+    return res.blob();
+  },
+  searchFiles: (pid, q, { regex, caseSensitive, cursor, limit } = {}, token) =>
+    request(
+      `/projects/${pid}/search?` +
+        new URLSearchParams({
+          q,
+          ...(regex ? { regex: "true" } : {}),
+          ...(caseSensitive ? { case: "true" } : {}),
+          ...(cursor ? { cursor } : {}),
+          ...(limit ? { limit: String(limit) } : {}),
+        }),
+      { token }
+    ),
   deleteFile: (pid, path, token) =>
     request(`/projects/${pid}/files?path=${encodeURIComponent(path)}`, {
       method: "DELETE",
@@ -125,7 +125,7 @@ export function CodeEditor({
                   content: model.getValue(),
                   cursor_line: position.lineNumber,
                   cursor_col: position.column,
-                  project_id: Number(projectId),
+                  project_id: projectId,
                 };
                 if (AI_DEBUG) console.log("[AI] calling /ai/suggest", payload);
                 const resp = await api.aiSuggest(authToken, payload);
@@ -177,7 +177,7 @@ export function CodeEditor({
                   content: model.getValue(),
                   cursor_line: position.lineNumber,
                   cursor_col: position.column,
-                  project_id: Number(projectId),
+                  project_id: projectId,
                 },
                 (delta) => {
                   streamingRef.current.accumulating += delta;